@@ -1,10 +1,46 @@
+import base64
 import json
-from fastapi import FastAPI, Query
+import logging
+import os
+import shutil
+import tempfile
+from typing import Literal
+from urllib.parse import urlencode
+from fastapi import Body, Depends, FastAPI, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 import duckdb
+import pyarrow as pa
 from fastapi.middleware.cors import CORSMiddleware
+from cache import ResponseCache
+from metrics import Metrics, count_returned, execute, phase, request_cursor, slow_query_log
+from partitions import data_files, data_version, index_path, source
+from projections import SUPPORTED, crs_column, crs_label, transform
+from pool import from_env
+from tiles import BUFFER, EXTENT, GRID_SIZES, RESOLUTIONS, TileCache, simplified_column, tile_bounds
 
 app = FastAPI()
 
+# Timings, rows and bytes per request, as a Server-Timing header and on /metrics. With BAG_SLOW_QUERY_SECONDS,
+# queries that take longer are logged with their EXPLAIN ANALYZE profile (to BAG_SLOW_QUERY_LOG, else stderr).
+# Registered first, so it measures the endpoints and not the responses served from the cache.
+slow_query_seconds = os.environ.get("BAG_SLOW_QUERY_SECONDS")
+metrics = Metrics(slow_query_seconds=float(slow_query_seconds) if slow_query_seconds else None)
+if os.environ.get("BAG_SLOW_QUERY_LOG"):
+    slow_query_log.addHandler(logging.FileHandler(os.environ["BAG_SLOW_QUERY_LOG"]))
+app.middleware("http")(metrics.dispatch)
+
+# Cache of whole GET responses, dropped as soon as one of the Parquet files is rewritten. Registered before
+# the CORS middleware so that responses from the cache get the CORS headers as well. Tiles have their own cache.
+response_cache = ResponseCache(
+    version=lambda: "|".join(data_version(output) for output in CACHED_FILES),
+    max_bytes=int(os.environ.get("BAG_RESPONSE_CACHE_BYTES", 128 * 1024 * 1024)),
+    max_entry_bytes=int(os.environ.get("BAG_RESPONSE_CACHE_ENTRY_BYTES", 4 * 1024 * 1024)),
+    max_age=int(os.environ.get("BAG_RESPONSE_MAX_AGE", 60)),
+    skip_media_types=("application/vnd.mapbox-vector-tile",),
+    skip_paths=("/metrics",),
+)
+app.middleware("http")(response_cache.dispatch)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -17,10 +53,325 @@ app.add_middleware(
 # Host link
 root = "godzilla.bk.tudelft.nl.bagparquet"
 
-# Connect to the DuckDB
-db = duckdb.connect()
-db.execute("INSTALL spatial")
-db.execute("LOAD spatial")
+# Parquet files of the collections. When the export wrote spatial partitions next to a file,
+# queries are routed to the partitions that can match (see partitions.py)
+PANDEN = 'bag.parquet'
+VERBLIJFSOBJECTEN = 'vbo.parquet'
+WOONPLAATSEN = 'mun.parquet'
+POSTCODES = 'postcode.parquet'
+
+# Statistics the export precomputed per cell of the grid pyramid and per woonplaats (db_to_parquet.py)
+GRID = 'grid.parquet'
+WOONPLAATS_STATISTICS = 'woonplaats_stats.parquet'
+
+# Every file a cached response can be read from: the collections, the aggregates (written last, in a step of
+# their own) and the lookup indexes
+CACHED_FILES = (PANDEN, VERBLIJFSOBJECTEN, WOONPLAATSEN, POSTCODES, GRID, WOONPLAATS_STATISTICS,
+                index_path(PANDEN), index_path(VERBLIJFSOBJECTEN), index_path(VERBLIJFSOBJECTEN, "pand"))
+
+# Properties of the features per collection: GeoJSON property name -> column
+PANDEN_PROPERTIES = {
+    "id": "identificatie",
+    "status": "status",
+    "oorspronkelijkBouwjaar": "oorspronkelijkBouwjaar",
+    "documentdatum": "documentdatum",
+    "area": "area",
+    "perimeter": "perimeter",
+    "centroid_x": "centroid_x",
+    "centroid_y": "centroid_y",
+    "vbo_count": "vbo_count",
+    "oppervlakte": "oppervlakte",
+}
+VERBLIJFSOBJECTEN_PROPERTIES = {
+    "id": "identificatie",
+    "status": "status",
+    "gebruiksdoel": "gebruiksdoel",
+    "documentdatum": "documentdatum",
+    "oppervlakte": "oppervlakte",
+    "pand": "pand",
+    "hoofdadres": "hoofdadres",
+}
+
+# Building metrics the export computed per pand (db_to_parquet.py) that panden can be filtered on (min_<column>,
+# max_<column>) and sorted on (sort=<column>, or sort=-<column> for descending)
+PANDEN_SORTS = tuple(sort for column in ("area", "perimeter", "vbo_count", "oppervlakte") for sort in (column, f"-{column}"))
+
+# Vector tile layers: Parquet file, lowest zoom level with features (below it a tile would hold a whole
+# province of buildings) and the attributes written to the tiles
+TILE_LAYERS = {
+    "panden": (PANDEN, 9, ["identificatie", "status", "oorspronkelijkBouwjaar"]),
+    "verblijfsobjecten": (VERBLIJFSOBJECTEN, 11, ["identificatie", "status", "gebruiksdoel", "oppervlakte", "pand"]),
+}
+
+# Collections that can be looked up by identificatie: Parquet file and feature properties
+ITEMS = {
+    "panden": (PANDEN, PANDEN_PROPERTIES),
+    "verblijfsobjecten": (VERBLIJFSOBJECTEN, VERBLIJFSOBJECTEN_PROPERTIES),
+}
+
+# Properties of the aggregates per grid cell or woonplaats
+STATISTICS_PROPERTIES = {
+    "panden": "panden",
+    "bouwjaar_mediaan": "bouwjaar_mediaan",
+    "verblijfsobjecten": "verblijfsobjecten",
+    "oppervlakte_som": "oppervlakte_som",
+    "gebruiksdoelen": "gebruiksdoelen",
+}
+GRID_PROPERTIES = {"cell_size": "cell_size", "x": "x", "y": "y", **STATISTICS_PROPERTIES}
+WOONPLAATS_STATISTICS_PROPERTIES = {"id": "identificatie", "naam": "naam", **STATISTICS_PROPERTIES}
+
+# Most grid cells in one aggregates response, and the extent of the Netherlands in RD New for requests without a bbox
+MAX_CELLS = 10000
+NL_EXTENT = (0, 300000, 300000, 625000)
+
+# Most identificaties resolved by one batch request
+MAX_BATCH = 100000
+
+# Bulk export formats: DuckDB COPY options (None: an Arrow IPC stream), media type and file extension
+EXPORT_FORMATS = {
+    "parquet": ("FORMAT parquet, COMPRESSION zstd", "application/vnd.apache.parquet", "parquet"),
+    "fgb": ("FORMAT GDAL, DRIVER 'FlatGeobuf'", "application/flatgeobuf", "fgb"),
+    "arrow": (None, "application/vnd.apache.arrow.stream", "arrows"),
+}
+# Bytes per chunk of an exported file, rows per Arrow record batch
+EXPORT_CHUNK_SIZE = 1024 * 1024
+EXPORT_BATCH_SIZE = 65536
+
+# Features per chunk of a streamed response
+FETCH_SIZE = 500
+
+# Box that intersects nothing, for a woonplaats or postcode that does not exist
+EMPTY_BOX = (float('inf'), float('inf'), float('-inf'), float('-inf'))
+
+# Pool of DuckDB cursors, sized and tuned with BAG_POOL_SIZE, BAG_DUCKDB_THREADS and BAG_DUCKDB_MEMORY_LIMIT
+pool = from_env()
+
+# Encoded vector tiles, on disk in BAG_TILE_CACHE and the most recent BAG_TILE_CACHE_BYTES in memory
+tile_cache = TileCache(os.environ.get("BAG_TILE_CACHE", "tile_cache"),
+                       int(os.environ.get("BAG_TILE_CACHE_BYTES", 256 * 1024 * 1024)))
+
+def get_db():
+    # Every request gets a cursor of its own for as long as its endpoint runs. The endpoints are plain functions,
+    # so FastAPI runs them (and their queries) in its thread pool, off the event loop. They read their results
+    # before they return (scope="function"), so the cursor is back in the pool while the response is sent.
+    with pool.cursor() as cur, request_cursor(cur):
+        yield cur
+
+def encode_cursor(key, identificatie, total_count):
+    # Opaque cursor for keyset pagination: the sort key (the Hilbert key, or the value of the sort column) and
+    # identificatie of the last returned feature and the total (if counted)
+    return base64.urlsafe_b64encode(json.dumps([key, identificatie, total_count]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        key, identificatie, total_count = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(key, bool) or not isinstance(key, (int, float)):
+            raise ValueError
+        return key, str(identificatie), total_count
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def page_href(path, params, cursor):
+    # Link to the next page with the same (set) query parameters
+    query = {key: value for key, value in params.items() if value is not None}
+    query["cursor"] = cursor
+    return f"{root}{path}?{urlencode(query)}"
+
+def feature_json(geom, properties, alias=None):
+    # SQL expression rendering a whole GeoJSON Feature as text, so the geometry is never parsed into
+    # Python objects and encoded again
+    prefix = f"{alias}." if alias else ""
+    props = ", ".join(f"{key} := {prefix}{column}" for key, column in properties.items())
+    return f"""'{{"type":"Feature","geometry":' || ST_AsGeoJSON({geom}) || ',"properties":' || to_json(struct_pack({props})) || '}}'"""
+
+def fetch_page(result, limit):
+    # The rows of a (limit + 1) query. They are read before the response is streamed, so the cursor goes back to the
+    # pool when the endpoint returns and a slow client does not keep it from other requests.
+    with phase("fetch"):
+        return result.fetchmany(limit + 1)
+
+def stream_features(rows, limit, collection_metadata, next_link):
+    # Write the FeatureCollection of the rows of fetch_page, in chunks of FETCH_SIZE features. The first column holds
+    # the Feature JSON; the row past the limit only tells whether next_link(last row) belongs in the links.
+    features = rows[:limit]
+    has_next = len(rows) > limit
+
+    def body():
+        yield b'{"type":"FeatureCollection","features":['
+        for start in range(0, len(features), FETCH_SIZE):
+            with phase("encode"):
+                chunk = (("," if start else "") + ",".join(row[0] for row in features[start:start + FETCH_SIZE])).encode()
+            yield chunk
+        count_returned(len(features))
+
+        links = [next_link(features[-1])] if has_next and next_link else []
+        tail = dict(collection_metadata, nr_of_returned_features=len(features), links=links)
+        yield b"]," + json.dumps(tail)[1:].encode()
+
+    return StreamingResponse(body(), media_type="application/geo+json")
+
+def stream_export(db, query, params, format, crs, filename):
+    # The rows of query in one of the EXPORT_FORMATS, written by DuckDB (or Arrow) to a file that is sent in chunks.
+    # The cursor is only needed to write the file (see get_db).
+    options, media_type, extension = EXPORT_FORMATS[format]
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{extension}"'}
+
+    directory = tempfile.mkdtemp(prefix="bag_export_")
+    path = os.path.join(directory, f"{filename}.{extension}")
+    try:
+        if options is None:
+            reader = execute(db, "export", query, params).to_arrow_reader(EXPORT_BATCH_SIZE)
+            with phase("export"), pa.ipc.new_stream(path, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+        else:
+            if format == "fgb":
+                options += f", SRS '{crs_label(crs)}'"
+            execute(db, "export", f"COPY ({query}) TO '{path}' ({options});", params)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    def body():
+        # Removed once it has been sent, or when the client went away
+        try:
+            with open(path, "rb") as f:
+                while chunk := f.read(EXPORT_CHUNK_SIZE):
+                    yield chunk
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+# Column names, row count and extent per Parquet file: file -> (data version, metadata). Read for every
+# collection at startup and again only when the export rewrote the file, from the footers and the GeoParquet
+# metadata, so no request has to scan a collection to count it.
+METADATA = {}
+
+def metadata(db, file):
+    version = data_version(file)
+    if file not in METADATA or METADATA[file][0] != version:
+        files = ", ".join(f"'{f}'" for f in data_files(file))
+        column_names = {row[0] for row in execute(db, "metadata", f"DESCRIBE SELECT * FROM {source(file)};").fetchall()}
+        count = execute(db, "metadata", f"SELECT sum(num_rows) FROM parquet_file_metadata([{files}]);").fetchone()[0]
+        extent = EMPTY_BOX
+        for value, in execute(db, "metadata", f"SELECT value FROM parquet_kv_metadata([{files}]) WHERE key = 'geo';").fetchall():
+            bbox = json.loads(value)["columns"].get("geom", {}).get("bbox") or EMPTY_BOX
+            extent = (min(extent[0], bbox[0]), min(extent[1], bbox[1]), max(extent[2], bbox[2]), max(extent[3], bbox[3]))
+        METADATA[file] = (version, {"columns": column_names, "count": count, "extent": extent if extent != EMPTY_BOX else None})
+    return METADATA[file][1]
+
+def columns(db, file):
+    return metadata(db, file)["columns"]
+
+def geometry(db, file, crs, column="geom", alias=None):
+    # A geometry column in the requested CRS: the one the export stored in that CRS, else transformed per row
+    prefix = f"{alias}." if alias else ""
+    if crs_column(crs, column) in columns(db, file):
+        return prefix + crs_column(crs, column)
+    return transform(prefix + column, crs)
+
+def lookup(db, file, ids, key="identificatie"):
+    # SQL relation (and its parameters) with the objects whose key is one of ids. Through the index on that key
+    # the export wrote, only the files and - by their Hilbert keys - row groups that hold them are read.
+    index = index_path(file, key)
+    if not os.path.exists(index):
+        return f"(SELECT * FROM {source(file)} WHERE {key} IN (SELECT unnest(?::VARCHAR[])))", [ids]
+
+    hits = execute(db, "index", f"""
+        SELECT file, hilbert, identificatie
+        FROM '{index}'
+        WHERE {key} IN (SELECT unnest(?::VARCHAR[]));
+    """, [ids]).fetchall()
+    if not hits:
+        return f"(SELECT * FROM {source(file)} LIMIT 0)", []
+
+    files = ", ".join(f"'{f}'" for f in sorted({hit[0] for hit in hits}))
+    return f"""(
+        SELECT obj.* FROM read_parquet([{files}]) AS obj
+        JOIN (SELECT unnest(?::UINTEGER[]) AS hilbert, unnest(?::VARCHAR[]) AS identificatie) AS hits
+        USING (hilbert, identificatie)
+    )""", [[hit[1] for hit in hits], [hit[2] for hit in hits]]
+
+def embed_verblijfsobjecten(db, rows, crs):
+    # Rows of (pand Feature JSON, sort key, identificatie) with the verblijfsobjecten of every pand added to its
+    # properties, all from one query grouped on pand. A Feature from feature_json ends in '}}', the end of its
+    # properties and of itself, so the array goes in right before that.
+    relation, params = lookup(db, VERBLIJFSOBJECTEN, [row[2] for row in rows], "pand")
+    units = dict(execute(db, "embed", f"""
+        SELECT pand, '[' || string_agg({feature_json(geometry(db, VERBLIJFSOBJECTEN, crs), VERBLIJFSOBJECTEN_PROPERTIES)}, ',' ORDER BY identificatie) || ']'
+        FROM {relation}
+        GROUP BY pand;
+    """, params).fetchall())
+    return [(f'{row[0][:-2]},"verblijfsobjecten":{units.get(row[2], "[]")}}}}}', *row[1:]) for row in rows]
+
+def filters(db, minx, miny, maxx, maxy, relation, woonplaats, postcode_4, alias=None):
+    # Boxes to route the query to the partitions that intersect the bbox and the woonplaats / postcode area,
+    # and the WHERE conditions of those filters
+    prefix = f"{alias}." if alias else ""
+    boxes = []
+    where_list = []
+    if None not in (minx, miny, maxx, maxy):
+        boxes.append((minx, miny, maxx, maxy))
+        # Filter on the bbox covering column, so the Parquet row group statistics can skip everything outside the view
+        if relation == 'within':
+            where_list.append(f"{prefix}bbox.xmax <= {maxx} AND {prefix}bbox.xmin >= {minx} AND {prefix}bbox.ymax <= {maxy} AND {prefix}bbox.ymin >= {miny}")
+        else:
+            where_list.append(f"{prefix}bbox.xmin <= {maxx} AND {prefix}bbox.xmax >= {minx} AND {prefix}bbox.ymin <= {maxy} AND {prefix}bbox.ymax >= {miny}")
+            where_list.append(f"ST_Intersects({prefix}geom, ST_MakeEnvelope({minx}, {miny}, {maxx}, {maxy}))")
+    # The export assigned every object to its woonplaats and postcode area, so these are plain column filters
+    if woonplaats:
+        ids = woonplaats_ids(db, woonplaats)
+        boxes.append(area_extent(db, WOONPLAATSEN, "identificatie", ids))
+        ids_list = ", ".join(f"'{identificatie}'" for identificatie in ids) or "NULL"
+        where_list.append(f"{prefix}woonplaats IN ({ids_list})")
+    if postcode_4 is not None:
+        boxes.append(area_extent(db, POSTCODES, "postcode", [postcode_4]))
+        where_list.append(f"{prefix}postcode_4 = {postcode_4}")
+    return boxes, where_list
+
+# Extent of every woonplaats and postcode area, and the identificaties per woonplaats name:
+# file -> (data version, {key: extent}, {naam: [identificaties]}). Like METADATA, read once per version of the file.
+AREAS = {}
+
+def areas(db, file, key):
+    version = data_version(file)
+    if file not in AREAS or AREAS[file][0] != version:
+        naam = "naam" if file == WOONPLAATSEN else "NULL"
+        rows = execute(db, "metadata", f"""
+            SELECT {key}, {naam}, ST_XMin(geom), ST_YMin(geom), ST_XMax(geom), ST_YMax(geom)
+            FROM '{file}';
+        """).fetchall()
+        extents, names = {}, {}
+        for row in rows:
+            box = extents.get(row[0], EMPTY_BOX)
+            extents[row[0]] = (min(box[0], row[2]), min(box[1], row[3]), max(box[2], row[4]), max(box[3], row[5]))
+            if row[0] not in names.get(row[1], []):
+                names.setdefault(row[1], []).append(row[0])
+        AREAS[file] = (version, extents, names)
+    return AREAS[file][1:]
+
+def area_extent(db, file, key, values):
+    # Bounding box of woonplaatsen or postcode areas, to route a query to the partitions they can touch
+    extents, _ = areas(db, file, key)
+    boxes = [extents[value] for value in values if value in extents]
+    if not boxes:
+        return EMPTY_BOX
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def woonplaats_ids(db, woonplaats):
+    # Identificaties of a woonplaats given by name or identificatie (a name is not unique)
+    extents, names = areas(db, WOONPLAATSEN, "identificatie")
+    return names.get(woonplaats, []) + ([woonplaats] if woonplaats in extents else [])
+
+# Read the metadata and the area extents before the first request, so that request does not pay for them
+with pool.cursor() as cur:
+    for file in (PANDEN, VERBLIJFSOBJECTEN, WOONPLAATSEN, POSTCODES, GRID, WOONPLAATS_STATISTICS):
+        if data_version(file) != "missing":
+            metadata(cur, file)
+    for file, key in ((WOONPLAATSEN, "identificatie"), (POSTCODES, "postcode")):
+        if data_version(file) != "missing":
+            areas(cur, file, key)
 
 # Root page
 @app.get("/")
@@ -52,6 +403,12 @@ def read_root():
                     "type": "application/json",
                     "title": "JSON representation of the list of all data layers (collections) served from this endpoint",
                     "href": f"{root}/collections"
+                },
+                {
+                    "rel": "aggregates",
+                    "type": "application/geo+json",
+                    "title": "Counts and statistics of panden and verblijfsobjecten per grid cell or woonplaats",
+                    "href": f"{root}/aggregates"
                 }
             ]
             }
@@ -78,21 +435,27 @@ def read_api():
     return {"title": "API definition TBA"
             }
 
+def collection_extent(file_metadata):
+    # OGC API extent of a collection, in RD New like the stored geometry
+    if file_metadata["extent"] is None:
+        return None
+    return {"spatial": {"bbox": [list(file_metadata["extent"])], "crs": "http://www.opengis.net/def/crs/EPSG/0/28992"}}
+
 # Collections endpoint
 @app.get("/collections")
-def read_collections():
+def read_collections(db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")):
     collection = []
 
-    total_count_panden = db.execute("""
-               SELECT COUNT(*)
-               FROM 'bag.parquet'""").fetchone()
+    # Counts and extents from the metadata of the files, not from a scan
+    pand_metadata = metadata(db, PANDEN)
 
     panden = {
         "id": 'panden',
         "title": f"panden in the Netherlands",
         "description": f"pand footprints for the Netherlands",
         "itemType": "feature",
-        "pand_count": total_count_panden,
+        "pand_count": pand_metadata["count"],
+        "extent": collection_extent(pand_metadata),
         "links": [
             {
                 "href": f"{root}/collections/panden/items",
@@ -104,16 +467,15 @@ def read_collections():
     }
     collection.append(panden)
 
-    total_count_vbo = db.execute("""
-               SELECT COUNT(*)
-               FROM 'vbo.parquet'""").fetchone()
+    vbo_metadata = metadata(db, VERBLIJFSOBJECTEN)
 
     vbo = {
         "id": 'verblijfsobjecten',
         "title": f"verblijfsobjecten in the Netherlands",
         "description": f"verblijfsobject points for the Netherlands",
         "itemType": "feature",
-        "verblijfsobject_count": total_count_vbo,
+        "verblijfsobject_count": vbo_metadata["count"],
+        "extent": collection_extent(vbo_metadata),
         "links": [
             {
                 "href": f"{root}/collections/verblijfsobjecten/items",
@@ -140,245 +502,367 @@ def read_panden_items(
         miny: float = Query(default=None),
         maxx: float = Query(default=None),
         maxy: float = Query(default=None),
-        crs: str = Query(default='EPSG:28992'),
+        crs: Literal[SUPPORTED] = Query(default='EPSG:28992'),
         woonplaats: str = Query(default=None),
-        postcode_4: str = Query(default=None),
+        postcode_4: int = Query(default=None),
+        relation: Literal['within', 'intersects'] = Query(default='within'), # panden fully inside the bbox, or touching it
+        resolution: float = Query(default=None, gt=0), # metres per pixel of the map: simplified footprints, no panden below a pixel
+        zoom: int = Query(default=None, ge=0, lt=len(RESOLUTIONS)), # zoom level of the web map, instead of a resolution
+        precision: float = Query(default=None, gt=0), # snap the coordinates to a grid of this size (in units of crs)
+        include: Literal['verblijfsobjecten'] = Query(default=None), # embed the verblijfsobjecten of every pand
+        min_area: float = Query(default=None), # footprint area in m2
+        max_area: float = Query(default=None),
+        min_vbo_count: int = Query(default=None), # number of verblijfsobjecten in the pand
+        max_vbo_count: int = Query(default=None),
+        min_oppervlakte: float = Query(default=None), # summed oppervlakte of its verblijfsobjecten in m2
+        max_oppervlakte: float = Query(default=None),
+        sort: Literal[PANDEN_SORTS] = Query(default=None), # a building metric, descending with a leading '-'; else along the Hilbert curve
         limit: int = Query(50, ge=1, le=1000), # always show at least 1 and no more than 1000
-        offset: int = Query(0, ge=0) # ensure that offset is always positive
+        cursor: str = Query(default=None), # opaque position of the next page, taken from the "next" link
+        count: bool = Query(default=True), # count the total number of matches on the first page
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
 ):
     woonplaats = woonplaats.capitalize() if woonplaats else None
-
-    from_list = ["'bag.parquet' AS pnd"]
-    if woonplaats:
-        from_list.append(f"(SELECT * FROM 'mun.parquet' WHERE naam = '{woonplaats}' OR identificatie = '{woonplaats}') as wpl")
-    if postcode_4:
-        from_list.append(f"(SELECT * FROM 'postcode.parquet' WHERE postcode = {postcode_4}) as psc")
-    from_statement = "FROM " + ", ".join(from_list)
-
-    where_list = []
-    if (minx and miny and maxx and maxy):
-        where_list.append(f"ST_XMax(pnd.geom) <= {maxx} AND ST_XMin(pnd.geom) >= {minx} AND ST_YMax(pnd.geom) <= {maxy} AND ST_YMin(pnd.geom) >= {miny}")
-    if woonplaats:
-        where_list.append("ST_Intersects(pnd.geom, wpl.geom)")
-    if postcode_4:
-        where_list.append("ST_Intersects(pnd.geom, psc.geom)")
+    if resolution is None and zoom is not None:
+        resolution = RESOLUTIONS[zoom]
+
+    boxes, where_list = filters(db, minx, miny, maxx, maxy, relation, woonplaats, postcode_4, "pnd")
+    from_statement = f"FROM {source(PANDEN, boxes)} AS pnd"
+
+    if resolution:
+        # Panden smaller than a pixel would not show on the map
+        where_list.append(f"greatest(pnd.bbox.xmax - pnd.bbox.xmin, pnd.bbox.ymax - pnd.bbox.ymin) >= {resolution}")
+    # The building metrics are plain columns, so the row group statistics can skip what is out of range
+    for column, low, high in (("area", min_area, max_area), ("vbo_count", min_vbo_count, max_vbo_count),
+                              ("oppervlakte", min_oppervlakte, max_oppervlakte)):
+        if low is not None:
+            where_list.append(f"pnd.{column} >= {low}")
+        if high is not None:
+            where_list.append(f"pnd.{column} <= {high}")
     where_statement = "WHERE " + " AND ".join(where_list) if len(where_list) > 0 else ""
 
-    geom_crs = "pnd.geom" if crs == 'EPSG:28992' else f"ST_Transform(pnd.geom,'EPSG:28992','{crs}')"
-
-    ## Count how many buildings in the bbox
-    total_count_b_in_bbox = db.execute(f"""
-            SELECT COUNT(pnd.identificatie)
-            {from_statement}
-            {where_statement};
-        """).fetchone()
-    total_count = total_count_b_in_bbox[0]
+    # The footprints simplified at export for the requested resolution (see tiles.py)
+    geom = simplified_column(resolution) if resolution else "geom"
+    geom_crs = geometry(db, PANDEN, crs, geom, "pnd")
+    if precision:
+        geom_crs = f"ST_ReducePrecision({geom_crs}, {precision})"
+
+    # Keyset pagination: continue after the (sort key, identificatie) of the last feature of the previous page.
+    # Along the Hilbert curve the first conjunct is pruned on the row group statistics, unlike an OFFSET. The files
+    # are not sorted on the metrics, so a page sorted on one still reads every row group that matches the filters.
+    # A metric without a value (a pand without geometry) sorts as 0, so every row has a key the cursor can hold.
+    sort_key = f"coalesce(pnd.{sort.lstrip('-')}, 0)" if sort else "pnd.hilbert"
+    descending = sort is not None and sort.startswith("-")
+    before, after = ("<", "<=") if descending else (">", ">=")
+    page_list = list(where_list)
+    params = []
+    total_count = None
+    if cursor:
+        last_key, last_id, total_count = decode_cursor(cursor)
+        page_list.append(f"{sort_key} {after} ? AND ({sort_key} {before} ? OR pnd.identificatie > ?)")
+        params = [last_key, last_key, last_id]
+    page_statement = "WHERE " + " AND ".join(page_list) if len(page_list) > 0 else ""
+
+    ## Count how many buildings in the bbox, only once: later pages carry the total in their cursor
+    if cursor is None and count:
+        total_count_b_in_bbox = execute(db, "count", f"""
+                SELECT COUNT(pnd.identificatie)
+                {from_statement}
+                {where_statement};
+            """).fetchone()
+        total_count = total_count_b_in_bbox[0]
 
-    ## Get the buildings in this bbox
-    db_result = db.execute(f"""
-            SELECT pnd.identificatie, pnd.status, pnd.oorspronkelijkBouwjaar, pnd.documentdatum, ST_AsGeoJSON({geom_crs}) AS geom
+    ## Get the buildings in this bbox, one extra to know if there is a next page
+    db_result = execute(db, "page", f"""
+            SELECT {feature_json(geom_crs, PANDEN_PROPERTIES, "pnd")} AS feature, {sort_key}, pnd.identificatie
             {from_statement}
-            {where_statement}
-            LIMIT ? OFFSET ?;
-        """, [limit, offset]).fetchall()
-
-    ## First build Features array per building
-    features = []
-    for row in db_result:
-        id = row[0]
-        status = row[1]
-        year = row[2]
-        doc = row[3]
-        geom = row[4]
-
-        feature = {
-            "type": "Feature",
-            "geometry": json.loads(geom),
-            "properties": {
-                "id": id,
-                "status": status,
-                "oorspronkelijkBouwjaar": year,
-                "documentdatum": doc
-            }
-        }
-        features.append(feature)
-
-    # Build a FeatureCollection from the buildings (Features) in the bbox and add metadata
-    feature_collection = {
-        "type": "FeatureCollection",
-        "features": features,
+            {page_statement}
+            ORDER BY {sort_key} {"DESC" if descending else "ASC"}, pnd.identificatie
+            LIMIT ?;
+        """, params + [limit + 1])
+    rows = fetch_page(db_result, limit)
+    if include == 'verblijfsobjecten':
+        rows = embed_verblijfsobjecten(db, rows, crs)
+
+    collection_metadata = {
         "total_feature_count": total_count,
         "current_limit": limit,
-        "current_offset": offset,
-        "nr_of_returned_features": len(features),
-        "links": []
+        "current_cursor": cursor,
     }
 
-    # When applicable, add links to the previous and next page (pagination)
-    # Link to next page
-    if offset + limit < total_count:
-        feature_collection["links"].append({
-            "href": f"{root}/collections/panden/items?minx={minx}&miny={miny}&maxx={maxx}&maxy={maxy}&woonplaats={woonplaats}&postcode_4={postcode_4}&crs={crs}&limit={limit}&offset={offset + limit}",
+    # Link to the next page (pagination), added when there is one
+    def next_link(last):
+        query = {"minx": minx, "miny": miny, "maxx": maxx, "maxy": maxy, "woonplaats": woonplaats, "postcode_4": postcode_4,
+                 "relation": relation, "resolution": resolution, "precision": precision, "include": include,
+                 "min_area": min_area, "max_area": max_area, "min_vbo_count": min_vbo_count, "max_vbo_count": max_vbo_count,
+                 "min_oppervlakte": min_oppervlakte, "max_oppervlakte": max_oppervlakte, "sort": sort,
+                 "crs": crs, "limit": limit}
+        return {
+            "href": page_href("/collections/panden/items", query, encode_cursor(last[1], last[2], total_count)),
             "rel": "next",
             "type": "application/geo+json",
             "title": f"Next page of panden (features) in the specified bounding box"
-        })
-
-    # Link to previous page
-    if offset > 0:
-        prev_offset = max(0, offset - limit)  # ensure that offset is always positive
-        feature_collection["links"].append({
-            "href": f"{root}/collections/panden/items?minx={minx}&miny={miny}&maxx={maxx}&maxy={maxy}&woonplaats={woonplaats}&postcode_4={postcode_4}&crs={crs}&limit={limit}&offset={prev_offset}",
-            "rel": "previous",
-            "type": "application/geo+json",
-            "title": f"Previous page of panden (features) in the specified bounding box"
-        })
+        }
 
-    return feature_collection
+    return stream_features(rows, limit, collection_metadata, next_link)
 
 
 # Panden endpoint
 @app.get("/collections/panden/items/{pandRef}")
 def read_pandRef(
         pandRef: str,
-        crs: str = Query(default='EPSG:28992')
+        crs: Literal[SUPPORTED] = Query(default='EPSG:28992'),
+        include: Literal['verblijfsobjecten'] = Query(default=None), # embed the verblijfsobjecten of the pand
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
 ):
-    geom_crs = "geom" if crs == 'EPSG:28992' else f"ST_Transform(geom,'EPSG:28992','{crs}')"
-
-    db_result = db.execute(f"""
-        SELECT identificatie, status, oorspronkelijkBouwjaar, documentdatum, ST_AsGeoJSON({geom_crs}) AS geom
-        FROM 'bag.parquet' 
-        WHERE identificatie = ?;
-    """, [pandRef]).fetchone()
-
-    identificatie, status, oorspronkelijkBouwjaar, documentdatum, geom = db_result
-
-    building = {
-    "type": "Feature",
-        "geometry": json.loads(geom),
-        "properties": {
-            "id": identificatie,
-            "status": status,
-            "oorspronkelijkBouwjaar": oorspronkelijkBouwjaar,
-            "documentdatum": documentdatum
-        }
-    }
+    geom_crs = geometry(db, PANDEN, crs)
+    relation, params = lookup(db, PANDEN, [pandRef])
+
+    db_result = execute(db, "item", f"""
+        SELECT {feature_json(geom_crs, PANDEN_PROPERTIES)}, hilbert, identificatie
+        FROM {relation};
+    """, params).fetchone()
+
+    if db_result is None:
+        raise HTTPException(status_code=404, detail="Pand not found")
+    count_returned(1)
+    if include == 'verblijfsobjecten':
+        db_result = embed_verblijfsobjecten(db, [db_result], crs)[0]
 
-    return building
+    return Response(content=db_result[0], media_type="application/geo+json")
 
 @app.get("/collections/verblijfsobjecten/items")
 def read_verblijfsobjecten_items(
-        crs: str = Query(default='EPSG:28992'),
+        crs: Literal[SUPPORTED] = Query(default='EPSG:28992'),
         pandRef: str = Query(default=None),
+        woonplaats: str = Query(default=None),
+        postcode_4: int = Query(default=None),
         limit: int = Query(50, ge=1, le=1000), # always show at least 1 and no more than 1000
-        offset: int = Query(0, ge=0) # ensure that offset is always positive
+        cursor: str = Query(default=None), # opaque position of the next page, taken from the "next" link
+        count: bool = Query(default=True), # count the total number of matches on the first page
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
 ):
-    geom_crs = "geom" if crs == 'EPSG:28992' else f"ST_Transform(geom,'EPSG:28992','{crs}')"
+    geom_crs = geometry(db, VERBLIJFSOBJECTEN, crs)
 
-    where_statement = f"WHERE pand = '{pandRef}'" if pandRef else ""
+    woonplaats = woonplaats.capitalize() if woonplaats else None
 
-    total_count_b_in_bbox = db.execute(f"""
-                SELECT COUNT(*)
-                FROM 'vbo.parquet'
-                {where_statement};
-            """).fetchone()
-    total_count = total_count_b_in_bbox[0]
-
-    ## Get the buildings in this bbox
-    db_result = db.execute(f"""
-             SELECT identificatie, status, gebruiksdoel, documentdatum, oppervlakte, pand, hoofdadres, ST_AsGeoJSON({geom_crs}) AS geom
-             FROM 'vbo.parquet'
-             {where_statement}
-             LIMIT ? OFFSET ?;
-         """, [limit, offset]).fetchall()
-
-    ## First build Features array per building
-    features = []
-    for row in db_result:
-        id = row[0]
-        status = row[1]
-        doel = row[2]
-        doc = row[3]
-        opp = row[4]
-        pand = row[5]
-        hoofdadres = row[6]
-        geom = row[7]
-
-        feature = {
-            "type": "Feature",
-            "geometry": json.loads(geom),
-            "properties": {
-                "id": id,
-                "status": status,
-                "gebruiksdoel": doel,
-                "documentdatum": doc,
-                "oppervlakte": opp,
-                "pand": pand,
-                "hoofdadres": hoofdadres,
-            }
-        }
-        features.append(feature)
+    boxes, where_list = filters(db, None, None, None, None, None, woonplaats, postcode_4)
+
+    # The verblijfsobjecten of a pand come from the pand index, everything else from the (routed) partitions
+    relation, params = lookup(db, VERBLIJFSOBJECTEN, [pandRef], "pand") if pandRef else (source(VERBLIJFSOBJECTEN, boxes), [])
 
-    # Build a FeatureCollection from the vbo (Features) in the bbox and add metadata
-    feature_collection = {
-        "type": "FeatureCollection",
-        "features": features,
+    where_statement = "WHERE " + " AND ".join(where_list) if len(where_list) > 0 else ""
+
+    # Keyset pagination, see read_panden_items
+    page_list = list(where_list)
+    page_params = list(params)
+    total_count = None
+    if cursor:
+        last_hilbert, last_id, total_count = decode_cursor(cursor)
+        page_list.append("hilbert >= ? AND (hilbert > ? OR identificatie > ?)")
+        page_params += [last_hilbert, last_hilbert, last_id]
+    page_statement = "WHERE " + " AND ".join(page_list) if len(page_list) > 0 else ""
+
+    if cursor is None and count:
+        total_count_b_in_bbox = execute(db, "count", f"""
+                    SELECT COUNT(*)
+                    FROM {relation}
+                    {where_statement};
+                """, params).fetchone()
+        total_count = total_count_b_in_bbox[0]
+
+    ## Get the verblijfsobjecten, one extra to know if there is a next page
+    db_result = execute(db, "page", f"""
+             SELECT {feature_json(geom_crs, VERBLIJFSOBJECTEN_PROPERTIES)} AS feature, hilbert, identificatie
+             FROM {relation}
+             {page_statement}
+             ORDER BY hilbert, identificatie
+             LIMIT ?;
+         """, page_params + [limit + 1])
+
+    collection_metadata = {
         "total_feature_count": total_count,
         "current_limit": limit,
-        "current_offset": offset,
-        "nr_of_returned_features": len(features),
-        "links": []
+        "current_cursor": cursor,
     }
 
-    # When applicable, add links to the previous and next page (pagination)
-    # Link to next page
-    if offset + limit < total_count:
-        feature_collection["links"].append({
-            "href": f"{root}/collections/verblijfsobjecten/items?pandRef={pandRef}&crs={crs}&limit={limit}&offset={offset + limit}",
+    # Link to the next page (pagination), added when there is one
+    def next_link(last):
+        query = {"pandRef": pandRef, "woonplaats": woonplaats, "postcode_4": postcode_4, "crs": crs, "limit": limit}
+        return {
+            "href": page_href("/collections/verblijfsobjecten/items", query, encode_cursor(last[1], last[2], total_count)),
             "rel": "next",
             "type": "application/geo+json",
             "title": f"Next page of verblijfsobjecten (features)"
-        })
-
-    # Link to previous page
-    if offset > 0:
-        prev_offset = max(0, offset - limit)  # ensure that offset is always positive
-        feature_collection["links"].append({
-            "href": f"{root}/collections/verblijfsobjecten/items?pandRef={pandRef}&crs={crs}&limit={limit}&offset={prev_offset}",
-            "rel": "previous",
-            "type": "application/geo+json",
-            "title": f"Previous page of verblijfsobjecten (features)"
-        })
+        }
 
-    return feature_collection
+    return stream_features(fetch_page(db_result, limit), limit, collection_metadata, next_link)
 
 @app.get("/collections/verblijfsobjecten/items/{vboRef}")
 def read_vboRef(
         vboRef: str,
-        crs: str = Query(default='EPSG:28992')
+        crs: Literal[SUPPORTED] = Query(default='EPSG:28992'),
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
+):
+    geom_crs = geometry(db, VERBLIJFSOBJECTEN, crs)
+    relation, params = lookup(db, VERBLIJFSOBJECTEN, [vboRef])
+
+    db_result = execute(db, "item", f"""
+        SELECT {feature_json(geom_crs, VERBLIJFSOBJECTEN_PROPERTIES)}
+        FROM {relation};
+    """, params).fetchone()
+
+    if db_result is None:
+        raise HTTPException(status_code=404, detail="Verblijfsobject not found")
+    count_returned(1)
+
+    return Response(content=db_result[0], media_type="application/geo+json")
+
+# Many panden or verblijfsobjecten by identificatie in one request
+@app.post("/collections/{collection_id}/items:batch")
+def read_items_batch(
+        collection_id: str,
+        ids: list[str] = Body(embed=True, max_length=MAX_BATCH),
+        crs: Literal[SUPPORTED] = Query(default='EPSG:28992'),
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
+):
+    if collection_id not in ITEMS:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    file, properties = ITEMS[collection_id]
+    relation, params = lookup(db, file, ids)
+
+    db_result = execute(db, "page", f"""
+        SELECT {feature_json(geometry(db, file, crs), properties)}
+        FROM {relation};
+    """, params)
+
+    # Identificaties that do not exist are left out
+    return stream_features(fetch_page(db_result, len(ids)), len(ids), {"nr_of_requested_features": len(ids)}, None)
+
+# Everything that matches the filters as one GeoParquet, FlatGeobuf or Arrow IPC stream
+@app.get("/collections/{collection_id}/export")
+def export_items(
+        collection_id: str,
+        format: Literal['parquet', 'fgb', 'arrow'] = Query(default='parquet'),
+        minx: float = Query(default=None),
+        miny: float = Query(default=None),
+        maxx: float = Query(default=None),
+        maxy: float = Query(default=None),
+        relation: Literal['within', 'intersects'] = Query(default='within'),
+        woonplaats: str = Query(default=None),
+        postcode_4: int = Query(default=None),
+        pandRef: str = Query(default=None), # the pand, or the verblijfsobjecten of the pand
+        crs: Literal[SUPPORTED] = Query(default='EPSG:28992'),
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
 ):
-    geom_crs = "geom" if crs == 'EPSG:28992' else f"ST_Transform(geom,'EPSG:28992','{crs}')"
+    if collection_id not in ITEMS:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    file, properties = ITEMS[collection_id]
+    woonplaats = woonplaats.capitalize() if woonplaats else None
 
-    db_result = db.execute(f"""
-        SELECT identificatie, status, gebruiksdoel, documentdatum, oppervlakte, pand, hoofdadres, ST_AsGeoJSON({geom_crs}) AS geom
-        FROM 'vbo.parquet' 
-        WHERE identificatie = ?;
-    """, [vboRef]).fetchone()
+    boxes, where_list = filters(db, minx, miny, maxx, maxy, relation, woonplaats, postcode_4)
+    if pandRef:
+        rows, params = lookup(db, file, [pandRef], "identificatie" if collection_id == "panden" else "pand")
+    else:
+        rows, params = source(file, boxes), []
+    where_statement = "WHERE " + " AND ".join(where_list) if len(where_list) > 0 else ""
 
-    identificatie, status, doel, doc, opp, pand, hoofdadres, geom = db_result
+    # The same properties as the GeoJSON features, with the geometry labelled with its CRS
+    selected = ", ".join(f"{column} AS {key}" for key, column in properties.items())
+    query = f"""
+        SELECT {selected}, ST_SetCRS({geometry(db, file, crs)}, '{crs_label(crs)}') AS geom
+        FROM {rows}
+        {where_statement}
+    """
 
-    vbo = {
-    "type": "Feature",
-            "geometry": json.loads(geom),
-            "properties": {
-                "id": identificatie,
-                "status": status,
-                "gebruiksdoel": doel,
-                "documentdatum": doc,
-                "oppervlakte": opp,
-                "pand": pand,
-                "hoofdadres": hoofdadres,
-            }
-    }
+    return stream_export(db, query, params, format, crs, collection_id)
 
-    return vbo
\ No newline at end of file
+# Histograms of the timings, rows and bytes of all requests, in the Prometheus text format
+@app.get("/metrics")
+def read_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Counts and statistics per grid cell or woonplaats, from the grid pyramid the export wrote
+@app.get("/aggregates")
+def read_aggregates(
+        minx: float = Query(default=None),
+        miny: float = Query(default=None),
+        maxx: float = Query(default=None),
+        maxy: float = Query(default=None),
+        by: Literal["grid", "woonplaats"] = Query(default="grid"),
+        cell_size: int = Query(default=None),
+        crs: Literal[SUPPORTED] = Query(default="EPSG:28992"),
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
+):
+    if None in (minx, miny, maxx, maxy):
+        minx, miny, maxx, maxy = NL_EXTENT
+
+    if by == "woonplaats":
+        rows = execute(db, "aggregates", f"""
+            SELECT {feature_json(geometry(db, WOONPLAATS_STATISTICS, crs), WOONPLAATS_STATISTICS_PROPERTIES)}
+            FROM '{WOONPLAATS_STATISTICS}'
+            WHERE bbox.xmin <= {maxx} AND bbox.xmax >= {minx} AND bbox.ymin <= {maxy} AND bbox.ymax >= {miny}
+            ORDER BY identificatie;
+        """)
+        return stream_features(fetch_page(rows, MAX_CELLS), MAX_CELLS, {"by": by}, None)
+
+    def cells(size):
+        return (maxx // size - minx // size + 1) * (maxy // size - miny // size + 1)
+
+    # Without a cell size, the finest level of the pyramid that covers the bbox in at most MAX_CELLS cells
+    if cell_size is None:
+        cell_size = next((size for size in GRID_SIZES if cells(size) <= MAX_CELLS), GRID_SIZES[-1])
+    elif cell_size not in GRID_SIZES:
+        raise HTTPException(status_code=400, detail=f"cell_size must be one of {GRID_SIZES}")
+    if cells(cell_size) > MAX_CELLS:
+        raise HTTPException(status_code=400, detail="Too many cells, use a larger cell_size or a smaller bbox")
+
+    cell = f"ST_MakeEnvelope(x * {cell_size}, y * {cell_size}, (x + 1) * {cell_size}, (y + 1) * {cell_size})"
+    rows = execute(db, "aggregates", f"""
+        SELECT {feature_json(transform(cell, crs), GRID_PROPERTIES)}
+        FROM '{GRID}'
+        WHERE cell_size = {cell_size}
+          AND x BETWEEN {minx // cell_size} AND {maxx // cell_size}
+          AND y BETWEEN {miny // cell_size} AND {maxy // cell_size}
+        ORDER BY x, y;
+    """)
+    return stream_features(fetch_page(rows, MAX_CELLS), MAX_CELLS, {"by": by, "cell_size": cell_size}, None)
+
+# Vector tiles on the RD New tile matrix of the web map (see tiles.py)
+@app.get("/collections/{collection_id}/tiles/{z}/{x}/{y}")
+def read_tile(
+        collection_id: str,
+        z: int,
+        x: int,
+        y: int,
+        db: duckdb.DuckDBPyConnection = Depends(get_db, scope="function")
+):
+    bounds = tile_bounds(z, x, y)
+    if collection_id not in TILE_LAYERS or bounds is None:
+        raise HTTPException(status_code=404, detail="Tile not found")
+    output, min_zoom, layer_columns = TILE_LAYERS[collection_id]
+    if z < min_zoom:
+        return Response(content=b"", media_type="application/vnd.mapbox-vector-tile")
+
+    # The cached tile is used as long as the export did not rewrite the collection
+    key = (collection_id, data_version(output), z, x, y)
+    tile = tile_cache.get(key)
+    if tile is None:
+        minx, miny, maxx, maxy = bounds
+        # Features in the buffer around the tile are part of it as well
+        pad = (maxx - minx) * BUFFER / EXTENT
+        box = (minx - pad, miny - pad, maxx + pad, maxy + pad)
+        attributes = ", ".join(f"'{column}': {column}" for column in layer_columns)
+
+        tile = execute(db, "tile", f"""
+            SELECT ST_AsMVT({{'geom': mvt_geom, {attributes}}}, '{collection_id}', {EXTENT}, 'geom')
+            FROM (
+                SELECT *, ST_AsMVTGeom(geom, ST_Extent(ST_MakeEnvelope({minx}, {miny}, {maxx}, {maxy})), {EXTENT}, {BUFFER}, true) AS mvt_geom
+                FROM {source(output, [box])}
+                WHERE bbox.xmin <= {box[2]} AND bbox.xmax >= {box[0]} AND bbox.ymin <= {box[3]} AND bbox.ymax >= {box[1]}
+            )
+            WHERE mvt_geom IS NOT NULL;
+        """).fetchone()[0] or b""
+        tile_cache.put(key, tile)
+
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile")
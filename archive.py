@@ -0,0 +1,126 @@
+import atexit
+import fnmatch
+import glob
+import io
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from contextlib import ExitStack, contextmanager
+
+# Separator between an archive and a member inside it: 'lvbag-extract-nl.zip!9999PND08122025.zip!9999PND08122025-000001.xml'
+SEP = "!"
+
+# Compressed archives inside an archive, extracted to a temporary file once per process: ref -> path. Seeking
+# backwards in a decompressed stream restarts it, so opening every member straight from the outer archive would
+# decompress the inner one again (up to its central directory at the end) for each member.
+EXTRACTED = {}
+
+@atexit.register
+def remove_extracted():
+    for path in EXTRACTED.values():
+        if os.path.exists(path):
+            os.remove(path)
+    EXTRACTED.clear()
+
+class Window(io.RawIOBase):
+    # Read-only view on a byte range of another file. A ZIP_STORED zip inside a zip is read through
+    # one of these, so seeking in the inner archive stays a plain seek on the outer file.
+    def __init__(self, f, start, size):
+        self.f = f
+        self.start = start
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, min(offset, self.size))
+        return self.pos
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self.pos)
+        if n <= 0:
+            return 0
+        self.f.seek(self.start + self.pos)
+        data = self.f.read(n)
+        b[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+def open_member(z, f, name):
+    # Open a member of zip z (read from file f) without extracting it
+    info = z.getinfo(name)
+    if info.compress_type == zipfile.ZIP_STORED:
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        return Window(f, info.header_offset + 30 + name_len + extra_len, info.file_size)
+    # Compressed members are decompressed on the fly (seekable, but backward seeks restart the stream)
+    return z.open(name)
+
+def open_archive(z, f, name, ref):
+    # Open an archive inside zip z (read from file f), ref being its full 'outer.zip!inner.zip' reference
+    if z.getinfo(name).compress_type == zipfile.ZIP_STORED:
+        return open_member(z, f, name)
+    if ref not in EXTRACTED:
+        fd, path = tempfile.mkstemp(prefix="bag_archive_", suffix=".zip")
+        try:
+            with os.fdopen(fd, "wb") as out, z.open(name) as inner:
+                shutil.copyfileobj(inner, out, 1024 * 1024)
+        except BaseException:
+            os.remove(path)
+            raise
+        EXTRACTED[ref] = path
+    return open(EXTRACTED[ref], "rb")
+
+@contextmanager
+def open_source(ref):
+    # Open a plain file or a (nested) archive member given as 'outer.zip!inner.zip!member.xml'
+    parts = ref.split(SEP)
+    with ExitStack() as stack:
+        f = stack.enter_context(open(parts[0], "rb"))
+        for i, name in enumerate(parts[1:], start=2):
+            z = stack.enter_context(zipfile.ZipFile(f))
+            if i < len(parts):
+                f = stack.enter_context(open_archive(z, f, name, SEP.join(parts[:i])))
+            else:
+                f = stack.enter_context(open_member(z, f, name))
+        yield f
+
+def list_members(ARCHIVE_PATH, pattern, zips="*.zip"):
+    # Refs of all members matching pattern, descending into nested archives that match zips
+    refs = []
+
+    def walk(prefix, f):
+        with zipfile.ZipFile(f) as z:
+            for name in z.namelist():
+                base = os.path.basename(name)
+                if fnmatch.fnmatch(base, zips):
+                    with open_archive(z, f, name, prefix + SEP + name) as inner:
+                        walk(prefix + SEP + name, inner)
+                elif fnmatch.fnmatch(base, pattern):
+                    refs.append(prefix + SEP + name)
+
+    with open(ARCHIVE_PATH, "rb") as f:
+        walk(ARCHIVE_PATH, f)
+
+    return sorted(refs)
+
+def find_sources(SOURCE, pattern, zips="*.zip"):
+    # The input files of one object type, from a delivery zip or from a directory of extracted files
+    if zipfile.is_zipfile(SOURCE):
+        return list_members(SOURCE, pattern, zips)
+    return sorted(glob.glob(os.path.join(SOURCE, pattern)))
@@ -0,0 +1,330 @@
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import duckdb as db
+import main
+import mun
+import vbo
+from archive import find_sources
+from db_to_parquet import COLLECTIONS, GRID_OUTPUT, WOONPLAATS_STATISTICS_OUTPUT
+from ingest import connect, create_table
+from partitions import data_files
+from synthetic import generate
+from tiles import ORIGIN, RESOLUTIONS, TILE_SIZE
+
+# Offline benchmark of the whole pipeline on a synthetic extract (synthetic.py): ingest throughput per file,
+# export time and size per collection and latency of the API endpoints, written as JSON so runs can be compared
+# (--compare). Everything runs in a scratch directory, with the scripts of this checkout.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PHASES = ["generate", "ingest", "export", "api"]
+
+# Ingest script, directory of the generated files and the files it reads, per collection
+INGEST = {
+    "woonplaatsen": (mun, "mun", "*WPL*.xml"),
+    "panden": (main, "data", "*PND*.xml"),
+    "verblijfsobjecten": (vbo, "vbo", "*VBO*.xml"),
+}
+
+# Order of the export, woonplaatsen and postcodes first as the others are assigned to them
+EXPORT = ["woonplaatsen", "postcodes", "panden", "verblijfsobjecten"]
+
+# Metrics that --compare reports, by the last part of their name
+COMPARED = ("seconds", "rows_per_second", "bytes", "p50", "p90", "p99", "requests_per_second")
+
+def percentile(values, p):
+    # Nearest rank
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+def bench_ingest(extractors):
+    results = {}
+    for name, (module, directory, pattern) in INGEST.items():
+        files = find_sources(directory, pattern)
+        for extractor in extractors:
+            xml_to_db = module.xml_to_db if extractor == "sql" else module.xml_to_db_stream
+            con = connect(module.DB_PATH, extractor == "sql")
+            create_table(con, module.TABLE, module.COLUMNS)
+
+            per_file = []
+            rows = 0
+            for path in files:
+                tic = time.perf_counter()
+                xml_to_db(con, module.TABLE, path)
+                seconds = time.perf_counter() - tic
+                total = con.execute(f"SELECT COUNT(*) FROM {module.TABLE};").fetchone()[0]
+                per_file.append({
+                    "file": os.path.basename(path),
+                    "bytes": os.path.getsize(path),
+                    "rows": total - rows,
+                    "seconds": seconds,
+                    "rows_per_second": (total - rows) / seconds,
+                })
+                rows = total
+            con.close()
+
+            seconds = sum(f["seconds"] for f in per_file)
+            results[f"{name}/{extractor}"] = {
+                "rows": rows,
+                "bytes": sum(f["bytes"] for f in per_file),
+                "seconds": seconds,
+                "rows_per_second": rows / seconds if seconds else None,
+                "files": per_file,
+            }
+            print(f"ingest {name} ({extractor}): {rows} rows in {seconds:.1f} s")
+    return results
+
+def bench_export(row_group_size, partition_size):
+    # All collections and the aggregates in one run of the export, as it is used, so collections that attach the
+    # same ingest database are exported on one connection. The times per step are the ones the export prints.
+    options = ["--row-group-size", str(row_group_size)]
+    if partition_size:
+        options += ["--partition-size", str(partition_size)]
+    tic = time.perf_counter()
+    run = subprocess.run([sys.executable, os.path.join(HERE, "db_to_parquet.py"), *EXPORT, *options],
+                         check=True, stdout=subprocess.PIPE, text=True)
+    results = {"total": {"seconds": time.perf_counter() - tic}}
+    seconds = dict(re.findall(r"^(\w+) -> .* - time: ([\d.]+) s$", run.stdout, re.MULTILINE))
+
+    for name in EXPORT:
+        output = COLLECTIONS[name]["output"]
+        results[name] = {
+            "seconds": float(seconds[name]),
+            "bytes": sum(os.path.getsize(f) for f in data_files(output)),
+        }
+        print(f"export {name}: {results[name]['seconds']:.1f} s, {results[name]['bytes'] / 1024 / 1024:.1f} MB")
+    results["aggregates"] = {
+        "seconds": float(seconds["aggregates"]),
+        "bytes": os.path.getsize(GRID_OUTPUT) + os.path.getsize(WOONPLAATS_STATISTICS_OUTPUT),
+    }
+    print(f"export total: {results['total']['seconds']:.1f} s")
+    return results
+
+def sample(n, seed):
+    # Centres and identificaties of random panden and verblijfsobjecten to aim the requests at
+    con = db.connect()
+    panden = "read_parquet([" + ", ".join(f"'{f}'" for f in data_files(COLLECTIONS["panden"]["output"])) + "])"
+    verblijfsobjecten = "read_parquet([" + ", ".join(f"'{f}'" for f in data_files(COLLECTIONS["verblijfsobjecten"]["output"])) + "])"
+    con.execute(f"SELECT setseed({seed % 1000 / 1000})")
+    centres = con.execute(f"""
+        SELECT (bbox.xmin + bbox.xmax) / 2, (bbox.ymin + bbox.ymax) / 2, identificatie
+        FROM {panden} ORDER BY random() LIMIT {n};
+    """).fetchall()
+    units = [row[0] for row in con.execute(f"SELECT identificatie FROM {verblijfsobjecten} ORDER BY random() LIMIT {n};").fetchall()]
+    con.close()
+    return centres, units
+
+def bbox_params(centre, size):
+    x, y = centre[0], centre[1]
+    return f"minx={x - size / 2:.0f}&miny={y - size / 2:.0f}&maxx={x + size / 2:.0f}&maxy={y + size / 2:.0f}"
+
+def fetch(base, request):
+    method, path, body = request
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if data else {}
+    tic = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(base + path, data=data, method=method, headers=headers)) as r:
+            size = len(r.read())
+            status = r.status
+    except urllib.error.HTTPError as e:
+        size = len(e.read())
+        status = e.code
+    return time.perf_counter() - tic, status, size
+
+def next_page(base, path, pages):
+    # Path of page number pages of a paged items request, by following the next links; None when there are
+    # fewer pages
+    for _ in range(pages - 1):
+        with urllib.request.urlopen(base + path) as r:
+            links = json.loads(r.read())["links"]
+        href = next((link["href"] for link in links if link["rel"] == "next"), None)
+        if href is None:
+            return None
+        path = href[href.index("/collections"):]
+    return path
+
+def cases(base, centres, units, args):
+    # Requests per case: (method, path, body), one per sampled pand
+    rng = random.Random(args.seed)
+    mid = args.bbox_sizes[len(args.bbox_sizes) // 2]
+    out = {}
+    for size in args.bbox_sizes:
+        out[f"panden/items bbox={size}"] = [("GET", f"/collections/panden/items?{bbox_params(c, size)}", None) for c in centres]
+        out[f"aggregates bbox={size}"] = [("GET", f"/aggregates?{bbox_params(c, size)}", None) for c in centres]
+    for limit in args.limits:
+        out[f"panden/items bbox={mid} limit={limit}"] = [("GET", f"/collections/panden/items?{bbox_params(c, mid)}&limit={limit}", None) for c in centres]
+    # The API pages with keyset cursors, so a deep page is reached by following the next links. Only the sampled
+    # panden with that many pages around them count; without any the case is skipped.
+    for pages in args.pages:
+        paths = [next_page(base, f"/collections/panden/items?{bbox_params(c, mid)}&limit=100", pages) for c in centres]
+        out[f"panden/items bbox={mid} page={pages}"] = [("GET", path, None) for path in paths if path is not None]
+    out[f"panden/items bbox={mid} sort=-oppervlakte min_vbo_count=1"] = [
+        ("GET", f"/collections/panden/items?{bbox_params(c, mid)}&sort=-oppervlakte&min_vbo_count=1", None) for c in centres
+    ]
+    out["panden/items/{pandRef}"] = [("GET", f"/collections/panden/items/{c[2]}", None) for c in centres]
+    out["panden/items/{pandRef}?include=verblijfsobjecten"] = [("GET", f"/collections/panden/items/{c[2]}?include=verblijfsobjecten", None) for c in centres]
+    out["verblijfsobjecten/items?pandRef"] = [("GET", f"/collections/verblijfsobjecten/items?pandRef={c[2]}", None) for c in centres]
+    out["verblijfsobjecten/items/{vboRef}"] = [("GET", f"/collections/verblijfsobjecten/items/{u}", None) for u in units]
+    out["panden/items:batch n=100"] = [("POST", "/collections/panden/items:batch", {"ids": rng.sample([c[2] for c in centres], min(100, len(centres)))}) for _ in centres]
+    for z in args.zooms:
+        span = RESOLUTIONS[z] * TILE_SIZE
+        out[f"panden/tiles z={z}"] = [("GET", f"/collections/panden/tiles/{z}/{int((c[0] - ORIGIN[0]) // span)}/{int((ORIGIN[1] - c[1]) // span)}", None) for c in centres]
+    out["aggregates by=woonplaats"] = [("GET", "/aggregates?by=woonplaats", None) for _ in centres]
+    out[f"panden/export parquet bbox={mid}"] = [("GET", f"/collections/panden/export?format=parquet&{bbox_params(c, mid)}", None) for c in centres]
+    return out
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def bench_api(args):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    tile_cache = os.path.abspath("tile_cache")
+    # Without the response cache every request runs its queries, and tiles are rendered again after every run
+    env = dict(os.environ, BAG_RESPONSE_CACHE_BYTES="0", BAG_TILE_CACHE=tile_cache, BAG_TILE_CACHE_BYTES="0")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "api:app", "--app-dir", HERE, "--port", str(port),
+                               "--log-level", "warning", "--workers", "1"], env=env)
+    try:
+        for _ in range(300):
+            try:
+                urllib.request.urlopen(base + "/")
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        centres, units = sample(args.requests, args.seed)
+        results = []
+        for name, requests in cases(base, centres, units, args).items():
+            if not requests:
+                results.extend({"case": name, "concurrency": concurrency, "requests": 0, "skipped": True}
+                               for concurrency in args.concurrency)
+                print(f"{name}: skipped, no requests")
+                continue
+            for concurrency in args.concurrency:
+                shutil.rmtree(tile_cache, ignore_errors=True)
+                tic = time.perf_counter()
+                with ThreadPoolExecutor(concurrency) as pool:
+                    timings = list(pool.map(lambda request: fetch(base, request), requests))
+                wall = time.perf_counter() - tic
+                latencies = [t[0] * 1000 for t in timings]
+                result = {
+                    "case": name,
+                    "concurrency": concurrency,
+                    "requests": len(timings),
+                    "errors": sum(1 for t in timings if t[1] >= 400),
+                    "bytes": sum(t[2] for t in timings) // len(timings),
+                    "mean": sum(latencies) / len(latencies),
+                    "p50": percentile(latencies, 50),
+                    "p90": percentile(latencies, 90),
+                    "p99": percentile(latencies, 99),
+                    "max": max(latencies),
+                    "requests_per_second": len(timings) / wall,
+                }
+                results.append(result)
+                print(f"{name} c={concurrency}: p50 {result['p50']:.1f} ms, p99 {result['p99']:.1f} ms, {result['requests_per_second']:.1f} req/s")
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+def flatten(result, prefix=""):
+    # Numeric metrics by path; API results by case and concurrency instead of position
+    out = {}
+    if isinstance(result, dict):
+        for key, value in result.items():
+            out.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(result, list):
+        for i, value in enumerate(result):
+            key = f"{value['case']} c={value['concurrency']}" if "case" in value else i
+            out.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(result, (int, float)) and not isinstance(result, bool):
+        out[prefix[:-1]] = result
+    return out
+
+def compare(previous, current):
+    before = flatten({key: previous.get(key) for key in PHASES})
+    after = flatten({key: current.get(key) for key in PHASES})
+    for key in sorted(before.keys() & after.keys()):
+        if key.rsplit(".", 1)[-1] in COMPARED and ".files." not in key and before[key]:
+            change = (after[key] - before[key]) / before[key] * 100
+            print(f"{key}: {before[key]:.4g} -> {after[key]:.4g} ({change:+.1f}%)")
+
+def meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": commit,
+        "python": platform.python_version(),
+        "duckdb": db.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest, export and API on a synthetic BAG extract")
+    parser.add_argument("--phases", nargs="*", choices=PHASES, default=PHASES,
+                        help="phases to run; later phases use what earlier runs left in --workdir")
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a temporary one, removed afterwards)")
+    parser.add_argument("--panden", type=int, default=100000, help="scale of the synthetic extract")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--extractors", nargs="*", choices=["sql", "stream"], default=["stream"],
+                        help="ingest extractors to measure (sql installs the webbed extension, which needs a network)")
+    parser.add_argument("--row-group-size", type=int, default=16384)
+    parser.add_argument("--partition-size", type=int, default=None, help="export panden and verblijfsobjecten as partitions")
+    parser.add_argument("--requests", type=int, default=20, help="requests per API case and concurrency level")
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 8])
+    parser.add_argument("--bbox-sizes", nargs="*", type=int, default=[100, 500, 2000, 10000], help="bbox sizes in metres")
+    parser.add_argument("--limits", nargs="*", type=int, default=[10, 100, 1000])
+    parser.add_argument("--pages", nargs="*", type=int, default=[1, 5, 20], help="page numbers of paged requests")
+    parser.add_argument("--zooms", nargs="*", type=int, default=[9, 12, 15], help="tile zoom levels")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None, help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    previous = args.compare and json.load(open(args.compare))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bag_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    results = {"meta": meta(args)}
+    try:
+        if "generate" in args.phases:
+            results["generate"] = generate(".", args.panden, args.seed)
+        if "ingest" in args.phases:
+            results["ingest"] = bench_ingest(args.extractors)
+        if "export" in args.phases:
+            results["export"] = bench_export(args.row_group_size, args.partition_size)
+        if "api" in args.phases:
+            results["api"] = bench_api(args)
+    finally:
+        if not args.workdir:
+            os.chdir(HERE)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results -> {output}")
+
+    if previous:
+        compare(previous, results)
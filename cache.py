@@ -0,0 +1,133 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+from fastapi.responses import Response
+
+# Query parameters that are normalized before they become part of a cache key. The request is rewritten to the
+# normalized parameters as well, so a cached response is exactly what the endpoint returns for them.
+BBOX_PARAMS = ("minx", "miny", "maxx", "maxy")
+BBOX_DECIMALS = 0 # metres in RD New
+LOWER_PARAMS = ("woonplaats",)
+UPPER_PARAMS = ("crs",)
+# Response headers that are not replayed from the cache: hop-by-hop headers belong to the connection, the length
+# is recomputed, the validators are set for every response and the timings are those of the original request
+SKIP_HEADERS = ("connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+                "transfer-encoding", "upgrade", "content-length", "set-cookie", "etag", "cache-control",
+                "server-timing")
+
+class LRUCache:
+    # Values with a size in bytes; the least recently used go first once the total exceeds max_bytes
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries or size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, old) = self.entries.popitem(last=False)
+                self.bytes -= old
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+def round_bbox(key, value):
+    scale = 10 ** BBOX_DECIMALS
+    rounded = math.floor(value * scale) if key.startswith("min") else math.ceil(value * scale)
+    return f"{rounded / scale:.{BBOX_DECIMALS}f}"
+
+def normalize_query(query_string):
+    params = []
+    for key, value in parse_qsl(query_string):
+        if key in BBOX_PARAMS:
+            # Rounded outwards, so the normalized bbox still covers the requested one and never collapses
+            try:
+                value = round_bbox(key, float(value))
+            except (ValueError, OverflowError):
+                pass # left for the endpoint to reject
+        elif key in LOWER_PARAMS:
+            value = value.lower()
+        elif key in UPPER_PARAMS:
+            value = value.upper()
+        params.append((key, value))
+    # Sorted on the name only, repeated parameters keep their order
+    return urlencode(sorted(params, key=lambda param: param[0]))
+
+class ResponseCache:
+    # Whole GET responses by path and normalized query, for as long as version() (the state of the data files)
+    # does not change. The ETag is derived from the same key and version, so conditional requests are answered
+    # with a 304 without running the endpoint at all.
+    def __init__(self, version, max_bytes, max_entry_bytes, max_age, skip_media_types=(), skip_paths=()):
+        self.version = version
+        self.entries = LRUCache(max_bytes)
+        self.max_entry_bytes = max_entry_bytes
+        self.max_age = max_age
+        self.skip_media_types = skip_media_types
+        self.skip_paths = skip_paths
+        self.current = None
+
+    async def dispatch(self, request, call_next):
+        if request.method != "GET" or request.url.path in self.skip_paths:
+            return await call_next(request)
+
+        query = normalize_query(request.scope["query_string"].decode("latin-1"))
+        request.scope["query_string"] = query.encode("latin-1")
+        key = f"{request.url.path}?{query}"
+
+        version = self.version()
+        if version != self.current:
+            # The data changed: nothing that is cached can be served any more
+            self.entries.clear()
+            self.current = version
+
+        etag = '"' + hashlib.sha1(f"{version} {key}".encode()).hexdigest() + '"'
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        cached = self.entries.get((version, key))
+        if cached is not None:
+            body, stored = cached
+            return Response(content=body, headers={**stored, **headers})
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        response.headers.update(headers)
+        media_type = response.headers.get("content-type")
+        if media_type not in self.skip_media_types:
+            # Content-Type, Content-Disposition etc. are kept with the body
+            stored = {name: value for name, value in response.headers.items() if name not in SKIP_HEADERS}
+            response.body_iterator = self.store(response.body_iterator, (version, key), stored)
+        return response
+
+    async def store(self, body_iterator, key, headers):
+        # Pass the (streamed) body on and keep a copy, unless it grows past max_entry_bytes
+        chunks = []
+        size = 0
+        async for chunk in body_iterator:
+            if chunks is not None:
+                size += len(chunk)
+                if size <= self.max_entry_bytes:
+                    chunks.append(chunk)
+                else:
+                    chunks = None
+            yield chunk
+        if chunks is not None:
+            self.entries.put(key, (b"".join(chunks), headers), size)
@@ -1,27 +1,462 @@
-import duckdb as db
+import argparse
+import json
+import os
+import shutil
+import tempfile
 import time
+import duckdb as db
+from partitions import data_files, index_path, partition_dir, load_manifest, write_manifest
+from projections import CRS, SUPPORTED, column_crs, crs_column, transform
+from tiles import GRID_SIZES, SIMPLIFIED, SIMPLIFIED_PRECISION
+
+# Extent of the Netherlands in RD New, used for the Hilbert ordering of every collection
+EXTENT = "ST_Extent(ST_MakeEnvelope(0, 280000, 310000, 640000))"
+
+# What to export per collection: the source (a table in one of the ingest databases, or any
+# table function such as ST_Read for the PC4 areas), the Parquet file that api.py reads, whether
+# the collection can be written as spatial partitions (see partitions.py) and which columns are
+# computed at export (areas, building metrics, simplified footprints, geometries in the --crs CRSs) and
+# the columns it gets a lookup index on
+COLLECTIONS = {
+    "panden": {
+        "db": "bag.db",
+        "table": "panden",
+        "output": "bag.parquet",
+        "partitioned": True,
+        "areas": True,
+        "metrics": True,
+        "simplified": True,
+        "transformed": True,
+        "indexes": ["identificatie"],
+    },
+    "verblijfsobjecten": {
+        "db": "vbo.db",
+        "table": "verblijfsobjecten",
+        "output": "vbo.parquet",
+        "partitioned": True,
+        "areas": True,
+        "transformed": True,
+        "indexes": ["identificatie", "pand"],
+    },
+    "woonplaatsen": {
+        "db": "mun.db",
+        "table": "municipalities",
+        "output": "mun.parquet",
+    },
+    "postcodes": {
+        "source": "ST_Read('cbs_pc4.gpkg')",
+        "select": "CAST(postcode AS INTEGER) AS postcode, geom",
+        "output": "postcode.parquet",
+    },
+}
+
+# Areas that panden and verblijfsobjecten are assigned to at export: column -> (collection, key of the area).
+# The API filters on these columns instead of intersecting every feature with the area at request time.
+AREAS = {
+    "woonplaats": ("woonplaatsen", "identificatie"),
+    "postcode_4": ("postcodes", "postcode"),
+}
+
+# Statistics of panden and verblijfsobjecten per cell of the grid pyramid and per woonplaats, for the
+# aggregates endpoint of the API
+GRID_OUTPUT = "grid.parquet"
+WOONPLAATS_STATISTICS_OUTPUT = "woonplaats_stats.parquet"
+
+# GeoParquet names of the geometry types DuckDB reports
+GEOMETRY_TYPES = {
+    "POINT": "Point",
+    "LINESTRING": "LineString",
+    "POLYGON": "Polygon",
+    "MULTIPOINT": "MultiPoint",
+    "MULTILINESTRING": "MultiLineString",
+    "MULTIPOLYGON": "MultiPolygon",
+    "GEOMETRYCOLLECTION": "GeometryCollection",
+}
+
+PROJJSON = {}
+
+def crs_projjson(con, crs):
+    # Let the spatial extension render the PROJJSON of a CRS by writing a single point with that CRS
+    if crs in PROJJSON:
+        return PROJJSON[crs]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "crs.parquet")
+        con.execute(f"COPY (SELECT ST_SetCRS(ST_Point(0, 0), '{crs}') AS geom) TO '{path}' (FORMAT parquet);")
+        geo = con.execute(f"SELECT decode(value) FROM parquet_kv_metadata('{path}') WHERE decode(key) = 'geo';").fetchone()[0]
+    PROJJSON[crs] = json.loads(geo)["columns"]["geom"]["crs"]
+    return PROJJSON[crs]
+
+def geo_metadata(con, relation):
+    # GeoParquet 1.1 metadata of every geometry column, with the bbox covering column of the primary one so
+    # readers can prune on its statistics. A column without a crs is longitude, latitude in WGS84 (OGC:CRS84).
+    columns = [column for column, type, *_ in con.execute(f"DESCRIBE SELECT * FROM {relation};").fetchall()
+               if type.startswith("GEOMETRY")]
+    stats = con.execute(f"""
+        SELECT {", ".join(f"min(ST_XMin({c})), min(ST_YMin({c})), max(ST_XMax({c})), max(ST_YMax({c})), "
+                          f"list(DISTINCT ST_GeometryType({c})::VARCHAR)" for c in columns)}
+        FROM {relation};
+    """).fetchone()
+
+    metadata = {"version": "1.1.0", "primary_column": "geom", "columns": {}}
+    for i, column in enumerate(columns):
+        xmin, ymin, xmax, ymax, types = stats[5 * i:5 * i + 5]
+        metadata["columns"][column] = {
+            "encoding": "WKB",
+            "geometry_types": sorted(GEOMETRY_TYPES[t] for t in types if t in GEOMETRY_TYPES),
+            "bbox": [xmin, ymin, xmax, ymax],
+        }
+        if column_crs(column) != "EPSG:4326":
+            metadata["columns"][column]["crs"] = crs_projjson(con, column_crs(column))
+    metadata["columns"]["geom"]["covering"] = {
+        "bbox": {
+            "xmin": ["bbox", "xmin"],
+            "ymin": ["bbox", "ymin"],
+            "xmax": ["bbox", "xmax"],
+            "ymax": ["bbox", "ymax"],
+        }
+    }
+    return metadata
+
+def source_relation(con, name, config, read_only=True):
+    if "db" in config:
+        attach(con, name, config["db"], read_only)
+        source = f"{name}_src.{config['table']}"
+    else:
+        source = config["source"]
+    return f"(SELECT {config.get('select', '*')} FROM {source})"
+
+def attach(con, name, path, read_only):
+    # Every ingest database is attached once per connection, whichever collection needs it first. A writable
+    # attachment serves reads as well; a read-only one is attached again when the export has to clear the mutation log.
+    row = con.execute("SELECT readonly FROM duckdb_databases() WHERE database_name = ?;", [f"{name}_src"]).fetchone()
+    if row is not None:
+        if read_only or not row[0]:
+            return
+        con.execute(f"DETACH {name}_src;")
+    mode = " (READ_ONLY)" if read_only else ""
+    con.execute(f"ATTACH '{path}' AS {name}_src{mode};")
+
+def with_areas(con, relation):
+    # Each feature gets the areas that contain a point on its surface, so a pand on a border belongs to one
+    # woonplaats only. DuckDB plans the ST_Contains joins as spatial joins with an R-tree on the areas.
+    columns = []
+    joins = []
+    for column, (collection, key) in AREAS.items():
+        area = source_relation(con, collection, COLLECTIONS[collection])
+        joins.append(f"LEFT JOIN {area} AS {column}_area ON ST_Contains({column}_area.geom::GEOMETRY, obj.point)")
+        columns.append(f"{column}_area.{key} AS {column}")
+    return f"""(
+        SELECT obj.* EXCLUDE (point), {", ".join(columns)}
+        FROM (SELECT *, ST_PointOnSurface(geom) AS point FROM {relation}) AS obj
+        {" ".join(joins)}
+    )"""
+
+def with_metrics(con, relation):
+    # Footprint area and perimeter (m, m2), centroid (RD New) and the number and summed oppervlakte of the
+    # verblijfsobjecten of every pand, so the API can filter and sort panden on them without their geometry
+    return f"""(
+        SELECT pnd.*, ST_Area(pnd.geom) AS area, ST_Perimeter(pnd.geom) AS perimeter,
+               ST_X(ST_Centroid(pnd.geom)) AS centroid_x, ST_Y(ST_Centroid(pnd.geom)) AS centroid_y,
+               coalesce(vbo.vbo_count, 0) AS vbo_count, coalesce(vbo.oppervlakte, 0) AS oppervlakte
+        FROM {relation} AS pnd
+        LEFT JOIN {vbo_metrics(con)} AS vbo ON vbo.pand = pnd.identificatie
+    )"""
+
+def vbo_metrics(con):
+    # The number and summed oppervlakte of the verblijfsobjecten per pand
+    verblijfsobjecten = source_relation(con, "verblijfsobjecten", COLLECTIONS["verblijfsobjecten"])
+    return f"""(
+        SELECT pand, COUNT(*) AS vbo_count, sum(oppervlakte)::BIGINT AS oppervlakte
+        FROM {verblijfsobjecten}
+        GROUP BY pand
+    )"""
+
+def stale_metrics(con, output, size):
+    # The cells of the panden partitions with a pand whose vbo_count or oppervlakte no longer matches its
+    # verblijfsobjecten. A verblijfsobject mutation changes them without any pand in the panden mutation log, and
+    # the verblijfsobjecten export clears its own log, so the partitions are compared with the verblijfsobjecten.
+    files = ", ".join(f"'{f}'" for f in data_files(output))
+    return f"""
+        SELECT DISTINCT floor((pnd.bbox.xmin + pnd.bbox.xmax) / 2 / {size})::INTEGER AS tile_x,
+                        floor((pnd.bbox.ymin + pnd.bbox.ymax) / 2 / {size})::INTEGER AS tile_y
+        FROM read_parquet([{files}]) AS pnd
+        LEFT JOIN {vbo_metrics(con)} AS vbo ON vbo.pand = pnd.identificatie
+        WHERE pnd.vbo_count <> coalesce(vbo.vbo_count, 0) OR pnd.oppervlakte <> coalesce(vbo.oppervlakte, 0)
+    """
+
+def with_simplified(relation):
+    # The footprint simplified per level of SIMPLIFIED, so the API can serve zoomed out maps without any work
+    columns = ", ".join(
+        f"ST_ReducePrecision(ST_SimplifyPreserveTopology(geom, {tolerance}), {SIMPLIFIED_PRECISION}) AS {column}"
+        for column, tolerance in SIMPLIFIED.items())
+    return f"(SELECT *, {columns} FROM {relation})"
+
+def with_transformed(relation, crss):
+    # The geometry in other CRSs, so the API does not have to transform it for every request
+    columns = ", ".join(f"{transform('geom', crs)} AS {crs_column(crs)}" for crs in crss)
+    return f"(SELECT *, {columns} FROM {relation})"
+
+def derived(con, config, relation, crss=()):
+    # The source with the columns computed at export
+    if config.get("areas"):
+        relation = with_areas(con, relation)
+    if config.get("metrics"):
+        relation = with_metrics(con, relation)
+    if config.get("simplified"):
+        relation = with_simplified(relation)
+    if config.get("transformed") and crss:
+        relation = with_transformed(relation, crss)
+    return relation
+
+def write_parquet(con, relation, output, row_group_size, compression_level):
+    # DuckDB's own 1.0.0 geo metadata is switched off, the 1.1 metadata with the covering is written instead
+    geo = json.dumps(geo_metadata(con, relation)).replace("'", "''")
+
+    con.execute(f"""
+        COPY (
+            SELECT *,
+                   struct_pack(xmin := ST_XMin(geom), ymin := ST_YMin(geom),
+                               xmax := ST_XMax(geom), ymax := ST_YMax(geom)) AS bbox,
+                   ST_Hilbert(geom, {EXTENT}) AS hilbert
+            FROM {relation}
+            ORDER BY hilbert
+        ) TO '{output}' (
+            FORMAT parquet,
+            COMPRESSION zstd,
+            COMPRESSION_LEVEL {compression_level},
+            ROW_GROUP_SIZE {row_group_size},
+            GEOPARQUET_VERSION 'NONE',
+            KV_METADATA {{geo: '{geo}'}}
+        );
+    """)
+
+def export_collection(con, name, config, row_group_size, compression_level, crss=()):
+    source = source_relation(con, name, config)
+    rows = derived(con, config, source, crss)
+    if rows == source:
+        write_parquet(con, source, config["output"], row_group_size, compression_level)
+    else:
+        # Computed once, the metadata and the file itself both read the result
+        con.execute(f"CREATE OR REPLACE TEMP TABLE {name}_rows AS SELECT * FROM {rows};")
+        write_parquet(con, f"{name}_rows", config["output"], row_group_size, compression_level)
+        con.execute(f"DROP TABLE {name}_rows;")
+
+    # The partitions of an earlier export would take precedence over the new file (see partitions.py)
+    shutil.rmtree(partition_dir(config["output"]), ignore_errors=True)
+
+def write_index(con, config, key, row_group_size, compression_level):
+    # key -> file, Hilbert key and identificatie of the object, sorted on key. A lookup then reads one row group
+    # of the index, and the Hilbert key leads it to one row group of the Hilbert-sorted data.
+    files = ", ".join(f"'{f}'" for f in data_files(config["output"]))
+    columns = ", ".join(dict.fromkeys([key, "identificatie"]))
+    con.execute(f"""
+        COPY (
+            SELECT {columns}, hilbert, filename AS file
+            FROM read_parquet([{files}], filename = true)
+            ORDER BY {key}
+        ) TO '{index_path(config["output"], key)}' (
+            FORMAT parquet,
+            COMPRESSION zstd,
+            COMPRESSION_LEVEL {compression_level},
+            ROW_GROUP_SIZE {row_group_size}
+        );
+    """)
+
+def statistics(panden, verblijfsobjecten, pand_key, vbo_key, key):
+    # Counts and statistics of panden and verblijfsobjecten grouped on key (pand_key / vbo_key compute it). A key
+    # with only panden or only verblijfsobjecten counts 0 of the other, not NULL.
+    return f"""
+        SELECT {key}, {statistics_columns()}
+        FROM (
+            SELECT {pand_key}, COUNT(*) AS panden, median(oorspronkelijkBouwjaar) AS bouwjaar_mediaan
+            FROM {panden}
+            GROUP BY ALL
+        ) FULL JOIN (
+            SELECT {vbo_key}, COUNT(*) AS verblijfsobjecten, sum(oppervlakte) AS oppervlakte_som,
+                   histogram(gebruiksdoel) AS gebruiksdoelen
+            FROM {verblijfsobjecten}
+            GROUP BY ALL
+        ) USING ({key})
+    """
+
+def statistics_columns(alias=None):
+    # The columns of statistics(), the counts 0 where there is nothing to count
+    prefix = f"{alias}." if alias else ""
+    return f"""coalesce({prefix}panden, 0) AS panden, {prefix}bouwjaar_mediaan,
+               coalesce({prefix}verblijfsobjecten, 0) AS verblijfsobjecten, coalesce({prefix}oppervlakte_som, 0) AS oppervlakte_som,
+               {prefix}gebruiksdoelen"""
+
+def export_aggregates(con, row_group_size, compression_level):
+    # The grid pyramid and the woonplaats statistics, from the exported panden and verblijfsobjecten. Every level
+    # is computed from the features themselves, so medians stay exact.
+    panden = "read_parquet([" + ", ".join(f"'{f}'" for f in data_files(COLLECTIONS["panden"]["output"])) + "])"
+    verblijfsobjecten = "read_parquet([" + ", ".join(f"'{f}'" for f in data_files(COLLECTIONS["verblijfsobjecten"]["output"])) + "])"
+
+    # A pand counts in the cell of its bbox centre, like it does for the partitions
+    levels = " UNION ALL ".join(statistics(
+        panden, verblijfsobjecten,
+        f"{size} AS cell_size, floor((bbox.xmin + bbox.xmax) / 2 / {size})::INTEGER AS x, floor((bbox.ymin + bbox.ymax) / 2 / {size})::INTEGER AS y",
+        f"{size} AS cell_size, floor(ST_X(geom) / {size})::INTEGER AS x, floor(ST_Y(geom) / {size})::INTEGER AS y",
+        "cell_size, x, y",
+    ) for size in GRID_SIZES)
+    con.execute(f"""
+        COPY (SELECT * FROM ({levels}) ORDER BY cell_size, x, y) TO '{GRID_OUTPUT}' (
+            FORMAT parquet,
+            COMPRESSION zstd,
+            COMPRESSION_LEVEL {compression_level},
+            ROW_GROUP_SIZE {row_group_size}
+        );
+    """)
+
+    # Per woonplaats, with its outline simplified to 10 m for overview maps. A woonplaats without any panden or
+    # verblijfsobjecten has no statistics to join, so its counts are 0 as well.
+    woonplaatsen = source_relation(con, "woonplaatsen", COLLECTIONS["woonplaatsen"])
+    by_woonplaats = statistics(panden, verblijfsobjecten, "woonplaats", "woonplaats", "woonplaats")
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE woonplaats_stats AS
+        SELECT wpl.identificatie, wpl.naam, {statistics_columns("stats")}, ST_SimplifyPreserveTopology(wpl.geom, 10) AS geom
+        FROM {woonplaatsen} AS wpl
+        LEFT JOIN ({by_woonplaats}) AS stats ON stats.woonplaats = wpl.identificatie;
+    """)
+    write_parquet(con, "woonplaats_stats", WOONPLAATS_STATISTICS_OUTPUT, row_group_size, compression_level)
+    con.execute("DROP TABLE woonplaats_stats;")
+
+def mutation_log(con, name, config):
+    # The <table>_mutaties log written by mutations.py, if any mutations were applied
+    return con.execute(f"""
+        SELECT COUNT(*) FROM duckdb_tables()
+        WHERE database_name = '{name}_src' AND table_name = '{config['table']}_mutaties';
+    """).fetchone()[0] > 0
+
+def export_partitioned(con, name, config, size, row_group_size, compression_level, incremental=False, crss=()):
+    # Write the collection as one file per cell of a fixed RD New grid of size x size metres. A feature goes to
+    # the cell of its bbox centre; the manifest records the real extent of every partition, so routing stays exact.
+    relation = source_relation(con, name, config, read_only=False)
+    rows = derived(con, config, relation, crss)
+    directory = partition_dir(config["output"])
+    os.makedirs(directory, exist_ok=True)
+
+    tile_x = f"floor((ST_XMin(geom) + ST_XMax(geom)) / 2 / {size})::INTEGER"
+    tile_y = f"floor((ST_YMin(geom) + ST_YMax(geom)) / 2 / {size})::INTEGER"
+
+    manifest = load_manifest(config["output"])
+    log = mutation_log(con, name, config)
+    if log:
+        applied = con.execute(f"SELECT max(applied)::VARCHAR FROM {name}_src.{config['table']}_mutaties;").fetchone()[0]
+
+    if incremental and manifest is not None and manifest["partition_size"] == size:
+        # Only the cells that contain an old or new extent of a mutated object, and with building metrics the
+        # cells of panden whose verblijfsobjecten changed
+        tiles = []
+        if log:
+            tiles.append(f"""
+                SELECT DISTINCT floor((minx + maxx) / 2 / {size})::INTEGER AS tile_x,
+                                floor((miny + maxy) / 2 / {size})::INTEGER AS tile_y
+                FROM {name}_src.{config['table']}_mutaties
+            """)
+        if config.get("metrics"):
+            tiles.append(stale_metrics(con, config["output"], size))
+        if not tiles:
+            return 0
+        con.execute(f"CREATE OR REPLACE TEMP TABLE tiles AS {' UNION '.join(tiles)};")
+        partitions = {tuple(p["tile"]): p for p in manifest["partitions"]}
+    else:
+        con.execute(f"CREATE OR REPLACE TEMP TABLE tiles AS SELECT DISTINCT {tile_x} AS tile_x, {tile_y} AS tile_y FROM {relation};")
+        partitions = {}
+        for f in os.listdir(directory):
+            if f.endswith(".parquet"):
+                os.remove(os.path.join(directory, f))
+
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE partition_rows AS
+        SELECT * FROM (SELECT *, {tile_x} AS tile_x, {tile_y} AS tile_y FROM {rows})
+        WHERE (tile_x, tile_y) IN (SELECT (tile_x, tile_y) FROM tiles)
+        ORDER BY tile_x, tile_y;
+    """)
+
+    stats = con.execute("""
+        SELECT t.tile_x, t.tile_y, COUNT(p.geom),
+               min(ST_XMin(p.geom)), min(ST_YMin(p.geom)), max(ST_XMax(p.geom)), max(ST_YMax(p.geom))
+        FROM tiles t LEFT JOIN partition_rows p USING (tile_x, tile_y)
+        GROUP BY ALL;
+    """).fetchall()
+
+    for tx, ty, count, xmin, ymin, xmax, ymax in stats:
+        path = f"{tx}_{ty}.parquet"
+        if count == 0:
+            # Everything in this cell was removed
+            partitions.pop((tx, ty), None)
+            if os.path.exists(os.path.join(directory, path)):
+                os.remove(os.path.join(directory, path))
+            continue
+
+        cell = f"(SELECT * EXCLUDE (tile_x, tile_y) FROM partition_rows WHERE tile_x = {tx} AND tile_y = {ty})"
+        write_parquet(con, cell, os.path.join(directory, path), row_group_size, compression_level)
+        partitions[(tx, ty)] = {"path": path, "tile": [tx, ty], "bbox": [xmin, ymin, xmax, ymax], "count": count}
+
+    write_manifest(config["output"], {
+        "collection": name,
+        "crs": CRS,
+        "partition_size": size,
+        "partitions": sorted(partitions.values(), key=lambda p: p["tile"]),
+    })
+
+    # Everything that was in the log when this export started is now in the partitions
+    if log and applied is not None:
+        con.execute(f"DELETE FROM {name}_src.{config['table']}_mutaties WHERE applied <= '{applied}';")
+
+    return len(stats)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the BAG collections to Hilbert-sorted GeoParquet")
+    parser.add_argument("collections", nargs="*", default=list(COLLECTIONS),
+                        help=f"collections to export: {', '.join(COLLECTIONS)} (default: all)")
+    parser.add_argument("--row-group-size", type=int, default=16384,
+                        help="rows per row group; smaller groups prune finer but have more overhead")
+    parser.add_argument("--compression-level", type=int, default=9, help="zstd compression level")
+    parser.add_argument("--partition-size", type=int, default=None,
+                        help="write panden and verblijfsobjecten as partitions on a grid of this many metres (RD New)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --partition-size: only rewrite the partitions touched by applied mutations")
+    parser.add_argument("--no-aggregates", action="store_true",
+                        help="do not rebuild the grid pyramid and woonplaats statistics after exporting panden or verblijfsobjecten")
+    parser.add_argument("--crs", nargs="*", default=[],
+                        help=f"also store panden and verblijfsobjecten in these CRSs: {', '.join(SUPPORTED[1:])}")
+    args = parser.parse_args()
+
+    for name in args.collections:
+        if name not in COLLECTIONS:
+            parser.error(f"unknown collection '{name}'")
+    for crs in args.crs:
+        if crs not in SUPPORTED[1:]:
+            parser.error(f"unsupported crs '{crs}'")
 
-con = db.connect("vbo.db")
+    con = db.connect()
+    con.install_extension("spatial")
+    con.load_extension("spatial")
 
-con.load_extension('spatial')
+    for name in args.collections:
+        config = COLLECTIONS[name]
 
-con.sql('''COPY 
-    (SELECT * FROM verblijfsobjecten ORDER BY
-    ST_Hilbert(geom, ST_Extent(ST_MakeEnvelope(0, 280000, 310000, 640000))))
-    TO 'vbo.parquet' (FORMAT 'parquet', COMPRESSION 'zstd');''')
+        tic = time.time()
+        if args.partition_size and config.get("partitioned"):
+            count = export_partitioned(con, name, config, args.partition_size, args.row_group_size,
+                                       args.compression_level, args.incremental, args.crs)
+            tac = time.time()
+            print(f"{name} -> {partition_dir(config['output'])}/ ({count} partitions written) - time: {tac - tic:.1f} s")
+        else:
+            export_collection(con, name, config, args.row_group_size, args.compression_level, args.crs)
+            tac = time.time()
+            size = os.path.getsize(config["output"]) / 1024 / 1024
+            print(f"{name} -> {config['output']} ({size:.1f} MB) - time: {tac - tic:.1f} s")
 
-minx = 250000
-miny = 590000
-maxx = 260000
-maxy = 600000
+        for key in config.get("indexes", []):
+            write_index(con, config, key, args.row_group_size, args.compression_level)
 
-tic = time.time()
-total = con.sql(f"""
-    SELECT COUNT(*) 
-    FROM 'vbo.parquet'
-    WHERE ST_Within(geom, ST_Extent(ST_MakeEnvelope({minx}, {miny}, {maxx}, {maxy})))
-""").fetchone()[0]
-tac = time.time()
-print(total, "- time:", (tac - tic) * 1000, "ms")
+    if not args.no_aggregates and {"panden", "verblijfsobjecten"} & set(args.collections):
+        tic = time.time()
+        export_aggregates(con, args.row_group_size, args.compression_level)
+        tac = time.time()
+        print(f"aggregates -> {GRID_OUTPUT}, {WOONPLAATS_STATISTICS_OUTPUT} - time: {tac - tic:.1f} s")
 
-con.close()
\ No newline at end of file
+    con.close()
@@ -0,0 +1,167 @@
+import pyarrow as pa
+import xml.etree.ElementTree as ET
+from archive import open_source
+from geometry import READERS, to_wkb
+
+# Namespaces used in the LVBAG extracts
+NS = {
+    "Objecten": "www.kadaster.nl/schemas/lvbag/imbag/objecten/v20200601",
+    "Objecten-ref": "www.kadaster.nl/schemas/lvbag/imbag/objecten-ref/v20200601",
+    "Historie": "www.kadaster.nl/schemas/lvbag/imbag/historie/v20200601",
+    "gml": "http://www.opengis.net/gml/3.2",
+}
+
+# Per object type: the element to stream, the text fields to pull out of every object (path relative
+# to the object), the kind of geometry with its default posList stride and the SELECT that casts the
+# raw columns to the columns of the target table
+PND = {
+    "object": "Objecten:Pand",
+    "fields": {
+        "identificatie": ".//Objecten:identificatie",
+        "status": ".//Objecten:status",
+        "oorspronkelijkBouwjaar": ".//Objecten:oorspronkelijkBouwjaar",
+        "documentdatum": ".//Objecten:documentdatum",
+        "eindGeldigheid": ".//Historie:eindGeldigheid",
+        "voorkomenidentificatie": ".//Historie:voorkomenidentificatie",
+    },
+    "geometry": ("polygon", 3),
+    "select": """
+      identificatie,
+      status,
+      TRY_CAST(oorspronkelijkBouwjaar AS INTEGER) AS oorspronkelijkBouwjaar,
+      TRY_CAST(documentdatum AS DATE) AS documentdatum,
+      TRY_CAST(voorkomenidentificatie AS INTEGER) AS voorkomenidentificatie,
+      ST_GeomFromWKB(geom) AS geom
+    """,
+}
+
+VBO = {
+    "object": "Objecten:Verblijfsobject",
+    "fields": {
+        "identificatie": ".//Objecten:identificatie",
+        "status": ".//Objecten:status",
+        "gebruiksdoel": ".//Objecten:gebruiksdoel",
+        "oppervlakte": ".//Objecten:oppervlakte",
+        "documentdatum": ".//Objecten:documentdatum",
+        "pand": ".//Objecten-ref:PandRef",
+        "hoofdadres": ".//Objecten:heeftAlsHoofdadres/Objecten-ref:NummeraanduidingRef",
+        "eindGeldigheid": ".//Historie:eindGeldigheid",
+        "voorkomenidentificatie": ".//Historie:voorkomenidentificatie",
+    },
+    "geometry": ("point", 3),
+    "select": """
+      identificatie,
+      status,
+      gebruiksdoel,
+      TRY_CAST(documentdatum AS DATE) AS documentdatum,
+      TRY_CAST(oppervlakte AS INTEGER) AS oppervlakte,
+      pand,
+      hoofdadres,
+      TRY_CAST(voorkomenidentificatie AS INTEGER) AS voorkomenidentificatie,
+      ST_GeomFromWKB(geom) AS geom
+    """,
+}
+
+WPL = {
+    "object": "Objecten:Woonplaats",
+    "fields": {
+        "identificatie": ".//Objecten:identificatie",
+        "naam": ".//Objecten:naam",
+        "status": ".//Objecten:status",
+        "documentdatum": ".//Objecten:documentdatum",
+        "eindGeldigheid": ".//Historie:eindGeldigheid",
+        "voorkomenidentificatie": ".//Historie:voorkomenidentificatie",
+    },
+    "geometry": ("polygon", 2),
+    "select": """
+      identificatie,
+      naam,
+      status,
+      TRY_CAST(documentdatum AS DATE) AS documentdatum,
+      TRY_CAST(voorkomenidentificatie AS INTEGER) AS voorkomenidentificatie,
+      ST_GeomFromWKB(geom) AS geom
+    """,
+}
+
+def expand(path):
+    # 'Objecten:status' -> '{www.kadaster.nl/...}status', so ElementTree can match the tags directly
+    for prefix, uri in NS.items():
+        path = path.replace(f"{prefix}:", f"{{{uri}}}")
+    return path
+
+# Elements of a mutation file that hold the old ('was') and the new ('wordt') state of an object
+MUTATION_ROLES = ("was", "wordt")
+
+def arrow_schema(SCHEMA, mutations=False):
+    # With mutations, every object also gets the role of the element it is in (see MUTATION_ROLES) and
+    # its position in the file
+    names = list(SCHEMA["fields"]) + (["mutatie", "volgnummer"] if mutations else [])
+    return pa.schema([(name, pa.string()) for name in names] + [("geom", pa.binary())])
+
+def mutation_role(stack):
+    # The role of the innermost was / wordt element around an object, None outside a mutation file
+    for elem in reversed(stack):
+        role = elem.tag.rsplit("}", 1)[-1]
+        if role in MUTATION_ROLES:
+            return role
+    return None
+
+def iter_batches(source, SCHEMA, batch_size=10000, mutations=False):
+    # Stream the document once and yield the fields of every object as columnar Arrow record batches.
+    # Every element is dropped from the tree as soon as it is closed, so memory stays flat with file size.
+    tag = expand(SCHEMA["object"])
+    fields = {name: expand(path) for name, path in SCHEMA["fields"].items()}
+    kind, dim = SCHEMA["geometry"]
+    read_geometry = READERS[kind]
+    schema = arrow_schema(SCHEMA, mutations)
+    names = list(schema.names[:-1])
+
+    columns = {name: [] for name in names}
+    geometries = []
+    count = 0 # objects in the batches already yielded
+    stack = []
+    inside = 0
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == tag:
+                inside += 1
+            continue
+
+        stack.pop()
+        if elem.tag == tag:
+            inside -= 1
+            for name, path in fields.items():
+                columns[name].append(elem.findtext(path))
+            if mutations:
+                columns["mutatie"].append(mutation_role(stack))
+                columns["volgnummer"].append(str(len(columns["volgnummer"]) + count))
+            geometries.append(read_geometry(elem, dim))
+
+        # Only keep elements while they are part of an object that is still being read
+        if inside == 0 and stack:
+            stack[-1].remove(elem)
+
+        if len(geometries) >= batch_size:
+            yield pa.record_batch([columns[name] for name in names] + [to_wkb(geometries, kind)], schema=schema)
+            count += len(geometries)
+            columns = {name: [] for name in names}
+            geometries = []
+
+    if geometries:
+        yield pa.record_batch([columns[name] for name in names] + [to_wkb(geometries, kind)], schema=schema)
+
+def stream_to_db(con, TABLE, XML_PATH, SCHEMA):
+    # One INSERT per file that consumes the record batches while the file is being parsed.
+    # XML_PATH can also point into a (nested) zip, see archive.open_source.
+    with open_source(XML_PATH) as f:
+        reader = pa.RecordBatchReader.from_batches(arrow_schema(SCHEMA), iter_batches(f, SCHEMA))
+        con.register("xml_batches", reader)
+        con.execute(f"""
+        INSERT INTO {TABLE}
+        SELECT {SCHEMA['select']}
+        FROM xml_batches
+        WHERE eindGeldigheid IS NULL
+        """)
+        con.unregister("xml_batches")
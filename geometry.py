@@ -0,0 +1,125 @@
+import numpy as np
+import pyarrow as pa
+
+GML = "{http://www.opengis.net/gml/3.2}"
+
+# WKB geometry type codes
+WKB_POINT = 1
+WKB_POLYGON = 3
+WKB_MULTIPOLYGON = 6
+
+def read_polygons(elem, dim):
+    # All gml:Polygon's of an object (one for a pand, one or more for a woonplaats MultiSurface), as a list
+    # of polygons that each are a list of (posList text, stride) rings: exterior first, then the interiors
+    polygons = []
+    for polygon in elem.iter(f"{GML}Polygon"):
+        stride = int(polygon.get("srsDimension", dim))
+        exterior = polygon.find(f"{GML}exterior/{GML}LinearRing/{GML}posList")
+        if exterior is None or not exterior.text:
+            continue
+        rings = [(exterior.text, int(exterior.get("srsDimension", stride)))]
+        for interior in polygon.findall(f"{GML}interior/{GML}LinearRing/{GML}posList"):
+            if interior.text:
+                rings.append((interior.text, int(interior.get("srsDimension", stride))))
+        polygons.append(rings)
+    return polygons or None
+
+def read_point(elem, dim):
+    pos = elem.find(f".//{GML}pos")
+    if pos is None or not pos.text:
+        return None
+    point = elem.find(f".//{GML}Point")
+    stride = int(pos.get("srsDimension", point.get("srsDimension", dim) if point is not None else dim))
+    return [[(pos.text, stride)]]
+
+# Packed (unaligned) records of little-endian WKB
+POINT = np.dtype([("order", "u1"), ("type", "<u4"), ("x", "<f8"), ("y", "<f8")])
+HEADER = np.dtype([("order", "u1"), ("type", "<u4"), ("count", "<u4")])
+
+def parse_rings(rings):
+    # Parse the coordinate text of all (text, stride) rings at once: one np.fromstring over the texts joined by
+    # a nan separator. Returns the x, y of all rings together (drops z of the 3D posLists) and the points per ring.
+    values = np.fromstring(" nan ".join(text for text, _ in rings), dtype=np.float64, sep=" ")
+    separators = np.flatnonzero(np.isnan(values))
+    lengths = np.diff(np.concatenate(([-1], separators, [len(values)]))) - 1
+    strides = np.array([stride for _, stride in rings])
+
+    values = values[~np.isnan(values)]
+    # Position of every value within its ring; x and y are the first two of every stride
+    position = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    xy = values[position % np.repeat(strides, lengths) < 2]
+    return np.ascontiguousarray(xy.reshape(-1, 2), dtype="<f8"), lengths // strides
+
+def exclusive_cumsum(values):
+    return np.cumsum(values) - values
+
+def within(offsets, counts):
+    # Offset of every element from the first one of its group, for groups of counts consecutive elements
+    return offsets - np.repeat(offsets[np.cumsum(counts) - counts], counts)
+
+def scatter(buffer, positions, records):
+    # Write one record (a row of a packed numpy array) into the byte buffer at each position
+    if not len(records):
+        return
+    raw = records.view(np.uint8).reshape(len(records), -1)
+    buffer[positions[:, None] + np.arange(raw.shape[1])] = raw
+
+def headers(geometry_type, counts):
+    records = np.empty(len(counts), dtype=HEADER)
+    records["order"] = 1
+    records["type"] = geometry_type
+    records["count"] = counts
+    return records
+
+def to_wkb(geometries, kind):
+    # Build little-endian WKB for a batch of geometries as read by read_polygons / read_point, as one Arrow binary
+    # array. The coordinates of the whole batch are parsed in one go and all WKB is written into one buffer, with
+    # the offsets of every header and ring computed by numpy; Python only flattens the lists of rings.
+    present = np.array([geometry is not None for geometry in geometries], dtype=bool)
+    geometries = [geometry for geometry in geometries if geometry is not None]
+    sizes = np.zeros(len(present), dtype=np.int64)
+
+    if not geometries:
+        buffer = np.empty(0, dtype=np.uint8)
+    elif kind == "point":
+        xy, points = parse_rings([geometry[0][0] for geometry in geometries])
+        records = np.empty(len(geometries), dtype=POINT)
+        records["order"] = 1
+        records["type"] = WKB_POINT
+        records["x"], records["y"] = xy[np.cumsum(points) - points].T
+        buffer = records.view(np.uint8)
+        sizes[present] = POINT.itemsize
+    else:
+        polygons = np.array([len(geometry) for geometry in geometries])
+        rings = np.array([len(polygon) for geometry in geometries for polygon in geometry])
+        xy, points = parse_rings([ring for geometry in geometries for polygon in geometry for ring in polygon])
+
+        # Bytes per ring, polygon and geometry; a geometry of more than one polygon is a MULTIPOLYGON
+        ring_sizes = 4 + 16 * points
+        polygon_sizes = HEADER.itemsize + np.add.reduceat(ring_sizes, np.cumsum(rings) - rings)
+        multi = polygons > 1
+        geometry_sizes = HEADER.itemsize * multi + np.add.reduceat(polygon_sizes, np.cumsum(polygons) - polygons)
+
+        # Where every part starts in the buffer
+        geometry_starts = exclusive_cumsum(geometry_sizes)
+        polygon_starts = (np.repeat(geometry_starts + HEADER.itemsize * multi, polygons)
+                          + within(exclusive_cumsum(polygon_sizes), polygons))
+        ring_starts = np.repeat(polygon_starts + HEADER.itemsize, rings) + within(exclusive_cumsum(ring_sizes), rings)
+        point_starts = np.repeat(ring_starts + 4, points) + 16 * within(np.arange(len(xy)), points)
+
+        buffer = np.empty(geometry_sizes.sum(), dtype=np.uint8)
+        scatter(buffer, geometry_starts[multi], headers(WKB_MULTIPOLYGON, polygons[multi]))
+        scatter(buffer, polygon_starts, headers(WKB_POLYGON, rings))
+        scatter(buffer, ring_starts, points.astype("<u4"))
+        scatter(buffer, point_starts, xy)
+        sizes[present] = geometry_sizes
+
+    offsets = np.concatenate(([0], np.cumsum(sizes))).astype("<i4")
+    validity = pa.py_buffer(np.packbits(present, bitorder="little"))
+    return pa.Array.from_buffers(pa.binary(), len(present), [validity, pa.py_buffer(offsets), pa.py_buffer(buffer)],
+                                 null_count=int((~present).sum()))
+
+READERS = {
+    "point": read_point,
+    "polygon": read_polygons,
+}
@@ -0,0 +1,76 @@
+import duckdb as db
+import os
+from multiprocessing import Pool
+
+def connect(DB_PATH, webbed=True, install=True):
+    con = db.connect(DB_PATH)
+    # The workers of ingest_parallel only load what the parent installed, so they do not all install at once
+    if install:
+        install_extensions(con, webbed)
+    con.load_extension("spatial")
+    # webbed is only needed for the read_xml_objects (sql) extractor
+    if webbed:
+        con.load_extension("webbed")
+    return con
+
+def install_extensions(con, webbed=True):
+    con.install_extension("spatial")
+    if webbed:
+        con.execute("INSTALL webbed FROM community")
+
+def create_table(con, TABLE, COLUMNS):
+    con.sql(f"DROP TABLE IF EXISTS {TABLE};")
+    con.sql(f"CREATE TABLE {TABLE} ({COLUMNS});")
+
+def ingest_shard(job):
+    # Runs inside a worker process: ingest one slice of the files into a shard database of its own
+    xml_to_db, SHARD_PATH, TABLE, COLUMNS, files, webbed = job
+
+    con = connect(SHARD_PATH, webbed, install=False)
+    # The parallelism comes from the processes, so keep DuckDB itself to one thread per worker
+    con.execute("SET threads = 1")
+    create_table(con, TABLE, COLUMNS)
+
+    for XML_PATH in files:
+        xml_to_db(con, TABLE, XML_PATH)
+
+    con.close()
+    return SHARD_PATH
+
+def ingest_parallel(xml_to_db, DB_PATH, TABLE, COLUMNS, files, workers, webbed=True):
+    # No more workers than files, and without files just the empty table
+    workers = min(workers, len(files))
+    if not workers:
+        con = connect(DB_PATH, webbed)
+        create_table(con, TABLE, COLUMNS)
+        return con
+
+    # Installed once, before the workers start
+    with db.connect() as con:
+        install_extensions(con, webbed)
+
+    # Split the file list round-robin over the workers, so each shard gets a similar amount of work
+    shard_dir = f"{DB_PATH}.shards"
+    os.makedirs(shard_dir, exist_ok=True)
+
+    jobs = []
+    for w in range(workers):
+        SHARD_PATH = os.path.join(shard_dir, f"{TABLE}_{w:03d}.db")
+        if os.path.exists(SHARD_PATH):
+            os.remove(SHARD_PATH)
+        jobs.append((xml_to_db, SHARD_PATH, TABLE, COLUMNS, files[w::workers], webbed))
+
+    with Pool(workers) as pool:
+        shards = pool.map(ingest_shard, jobs)
+
+    # Merge step: build the final table from all shards
+    con = connect(DB_PATH, webbed, install=False)
+    create_table(con, TABLE, COLUMNS)
+    for SHARD_PATH in shards:
+        con.execute(f"ATTACH '{SHARD_PATH}' AS shard (READ_ONLY);")
+        con.execute(f"INSERT INTO {TABLE} SELECT * FROM shard.{TABLE};")
+        con.execute("DETACH shard;")
+        os.remove(SHARD_PATH)
+    os.rmdir(shard_dir)
+
+    return con
@@ -1,7 +1,23 @@
-import duckdb as db
+import argparse
 import time
+import zipfile
+from archive import find_sources
+from extract import stream_to_db, PND
+from ingest import connect, create_table, ingest_parallel
 
-def xml_to_db(XML_PATH):
+# Database, table and columns the ingest writes
+DB_PATH = 'bag.db'
+TABLE = "panden"
+COLUMNS = """
+  identificatie TEXT,
+  status TEXT,
+  oorspronkelijkBouwjaar INTEGER,
+  documentdatum DATE,
+  voorkomenidentificatie INTEGER,
+  geom GEOMETRY
+"""
+
+def xml_to_db(con, TABLE, XML_PATH):
     con.sql(f"""
     INSERT INTO {TABLE}
     WITH docs AS (
@@ -17,6 +33,7 @@ def xml_to_db(XML_PATH):
         xml_extract_text(pand_xml, '//Objecten:status')[1] AS status,
         TRY_CAST(xml_extract_text(pand_xml, '//Objecten:oorspronkelijkBouwjaar')[1] AS INTEGER) AS oorspronkelijkBouwjaar,
         TRY_CAST(xml_extract_text(pand_xml, '//Objecten:documentdatum')[1] AS DATE) AS documentdatum,
+        TRY_CAST(xml_extract_text(pand_xml, '//Historie:voorkomenidentificatie')[1] AS INTEGER) AS voorkomenidentificatie,
         xml_extract_text(pand_xml, '//gml:posList')[1] AS poslist
       FROM panden_xml
       WHERE xml_extract_text(pand_xml, '//Historie:eindGeldigheid')[1] IS NULL
@@ -26,6 +43,7 @@ def xml_to_db(XML_PATH):
       status,
       oorspronkelijkBouwjaar,
       documentdatum,
+      voorkomenidentificatie,
       ST_GeomFromText(
           'POLYGON((' ||
           array_to_string(
@@ -43,40 +61,45 @@ def xml_to_db(XML_PATH):
         status,
         oorspronkelijkBouwjaar,
         documentdatum,
+        voorkomenidentificatie,
         list_filter(str_split(poslist, ' '), x -> x <> '') AS nums
       FROM extracted
     ) t
     """)
 
+def xml_to_db_stream(con, TABLE, XML_PATH):
+    stream_to_db(con, TABLE, XML_PATH, PND)
+
 if __name__ == "__main__":
-    con = db.connect('bag.db')
-    con.install_extension("spatial")
-    con.load_extension("spatial")
-    con.execute("INSTALL webbed FROM community")
-    con.load_extension("webbed")
+    parser = argparse.ArgumentParser(description="Ingest the BAG PND extract into bag.db")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (1 = sequential)")
+    parser.add_argument("--extractor", choices=["sql", "stream"], default="stream",
+                        help="sql: read_xml_objects + XPath in DuckDB, stream: single-pass incremental parser")
+    parser.add_argument("--source", default="data",
+                        help="directory with the extracted files or the (nested) LVBAG delivery zip")
+    args = parser.parse_args()
+
+    if args.extractor == "sql" and zipfile.is_zipfile(args.source):
+        parser.error("the sql extractor needs extracted files, use --extractor stream to read from the zip")
 
-    XML_PATH = 'data\*.xml'
-    TABLE = "panden"
+    files = find_sources(args.source, '*PND*.xml', zips='*PND*.zip')
+
+    extractor = xml_to_db if args.extractor == "sql" else xml_to_db_stream
+    webbed = args.extractor == "sql"
 
     tic = time.time()
 
-    con.sql(f"DROP TABLE IF EXISTS {TABLE};")
-    con.sql(f"""
-    CREATE TABLE {TABLE} (
-      identificatie TEXT,
-      status TEXT,
-      oorspronkelijkBouwjaar INTEGER,
-      documentdatum DATE,
-      geom GEOMETRY
-    );
-    """)
+    if args.workers > 1:
+        con = ingest_parallel(extractor, DB_PATH, TABLE, COLUMNS, files, args.workers, webbed)
+    else:
+        con = connect(DB_PATH, webbed)
+        create_table(con, TABLE, COLUMNS)
 
-    for i in range(1,2391):
-        XML_PATH = f'data\9999PND08122025-{i:06d}.xml'
-        if i//100 == 0:
-            print(i)
-            print("time:", (time.time() - tic), "s")
-        xml_to_db(XML_PATH)
+        for i, XML_PATH in enumerate(files, start=1):
+            if i//100 == 0:
+                print(i)
+                print("time:", (time.time() - tic), "s")
+            extractor(con, TABLE, XML_PATH)
 
     tac = time.time()
 
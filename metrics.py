@@ -0,0 +1,212 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import duckdb
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1000, 10000, 100000, 1000000, 10000000, 100000000, 1000000000)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+
+# EXPLAIN ANALYZE profiles of the queries slower than Metrics.slow_query_seconds
+slow_query_log = logging.getLogger("bag.slow_query")
+
+class Histogram:
+    # Prometheus histogram per combination of label values
+    def __init__(self, name, description, buckets, labels):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, values, value):
+        with self.lock:
+            counts, total = self.series.get(values, ([0] * (len(self.buckets) + 1), 0))
+            counts[next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))] += 1
+            self.series[values] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted((values, list(counts), total) for values, (counts, total) in self.series.items())
+        for values, counts, total in series:
+            labels = ",".join(f'{label}="{value}"' for label, value in zip(self.labels, values))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+class RequestMetrics:
+    # Timings and counters of one request. The endpoint, its streamed body and the teardown of its cursor all
+    # add to it; it is observed once the last of them is done.
+    def __init__(self, slow_query_seconds, done):
+        self.slow_query_seconds = slow_query_seconds
+        self.done = done
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.rows_read = 0
+        self.rows_scanned = 0
+        self.rows_returned = 0
+        self.bytes = 0
+        self.query = None # the last query on the cursor, until its profile is read
+        self.open = 1
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def hold(self):
+        with self.lock:
+            self.open += 1
+
+    def release(self):
+        with self.lock:
+            self.open -= 1
+            if self.open:
+                return
+        self.done(self)
+
+    def server_timing(self):
+        phases = [*self.phases.items(), ("total", time.perf_counter() - self.start)]
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases)
+
+# The metrics of the request being handled. The endpoint runs in a copy of the context of the middleware,
+# so it sees (and adds to) the same RequestMetrics.
+current = contextvars.ContextVar("request_metrics", default=None)
+
+@contextmanager
+def phase(name):
+    tic = time.perf_counter()
+    try:
+        yield
+    finally:
+        request = current.get()
+        if request is not None:
+            request.add(name, time.perf_counter() - tic)
+
+def count_returned(rows):
+    request = current.get()
+    if request is not None:
+        request.rows_returned += rows
+
+def execute(db, name, query, params=None):
+    # db.execute, timed as phase name of the request
+    finish(db)
+    with phase(name):
+        result = db.execute(query, params)
+    request = current.get()
+    if request is not None:
+        request.query = (query, params)
+    return result
+
+def scanned(node, parent=None):
+    # Rows that came out of the scans in a DuckDB profile (tree): after the filters the scan applied itself (also
+    # the dynamic filters a join pushed into it), or after the FILTER right above it
+    rows = 0
+    if node.get("operator_rows_scanned"):
+        filtered = parent if parent is not None and parent.get("operator_type") == "FILTER" else node
+        rows += filtered.get("operator_cardinality", 0)
+    for child in node.get("children", []):
+        rows += scanned(child, node)
+    return rows
+
+def finish(db):
+    # Rows read and scanned by the last query on the cursor, from its DuckDB profile. The profile is only complete
+    # once the result has been read to the end, so whatever the endpoint left of it is read first.
+    request = current.get()
+    if request is None or request.query is None:
+        return
+    query, params = request.query
+    request.query = None
+    try:
+        db.fetchall()
+        profile = json.loads(db.get_profiling_information(format="json"))
+    except (duckdb.Error, ValueError):
+        return
+    # DuckDB's own rows_scanned counts every row of the row groups it read, before any filter: a lookup of one pand
+    # reads a whole row group. That is kept as the rows read; the rows scanned are those that passed the filters.
+    request.rows_read += profile.get("cumulative_rows_scanned", 0)
+    request.rows_scanned += scanned(profile)
+
+    seconds = profile.get("latency", 0)
+    slow = request.slow_query_seconds
+    if slow is not None and seconds >= slow and query.lstrip().upper().startswith(("SELECT", "WITH")):
+        # Runs the query once more, with the time per operator
+        plan = db.execute(f"EXPLAIN ANALYZE {query}", params).fetchall()
+        slow_query_log.warning("%.3f s, %d rows read, %d rows scanned\n%s", seconds, profile.get("cumulative_rows_scanned", 0),
+                               scanned(profile), plan[0][1])
+
+@contextmanager
+def request_cursor(db):
+    # Reads the profile of the last query of a request on its cursor, before the cursor goes back to the pool
+    request = current.get()
+    if request is None:
+        yield db
+        return
+    request.hold()
+    try:
+        yield db
+    finally:
+        finish(db)
+        request.release()
+
+class Metrics:
+    # Histograms of all requests by route, exposed in the Prometheus text format, and the Server-Timing header with
+    # the phases of a request up to its first byte. Phases of a streamed body (fetching and encoding the rows)
+    # end after the headers are sent, so they only show in the histograms.
+    def __init__(self, slow_query_seconds=None):
+        self.slow_query_seconds = slow_query_seconds
+        self.duration = Histogram("bag_request_duration_seconds", "Time from the request to the last byte of the response",
+                                  SECONDS_BUCKETS, ("route", "method", "status"))
+        self.phases = Histogram("bag_request_phase_seconds", "Time per phase of a request (queries, fetching, encoding)",
+                                SECONDS_BUCKETS, ("route", "phase"))
+        self.bytes = Histogram("bag_response_bytes", "Bytes of the response body", BYTES_BUCKETS, ("route",))
+        self.rows_read = Histogram("bag_rows_read", "Rows DuckDB read from the row groups it did not skip, before any filter",
+                                   ROWS_BUCKETS, ("route",))
+        self.rows_scanned = Histogram("bag_rows_scanned", "Rows that passed the filters of the scans of a request",
+                                      ROWS_BUCKETS, ("route",))
+        self.rows_returned = Histogram("bag_rows_returned", "Features or rows in a response", ROWS_BUCKETS, ("route",))
+
+    async def dispatch(self, request, call_next):
+        labels = {}
+        metrics = RequestMetrics(self.slow_query_seconds, lambda done: self.observe(done, **labels))
+        token = current.set(metrics)
+        try:
+            response = await call_next(request)
+        finally:
+            current.reset(token)
+
+        # The route the request matched, so all features of one endpoint share their histograms
+        route = request.scope.get("route")
+        labels.update(route=route.path if route else "unmatched", method=request.method, status=str(response.status_code))
+        response.headers["Server-Timing"] = metrics.server_timing()
+        response.body_iterator = self.count(response.body_iterator, metrics)
+        return response
+
+    async def count(self, body_iterator, metrics):
+        async for chunk in body_iterator:
+            metrics.bytes += len(chunk)
+            yield chunk
+        metrics.release()
+
+    def observe(self, metrics, route, method, status):
+        self.duration.observe((route, method, status), time.perf_counter() - metrics.start)
+        for name, seconds in metrics.phases.items():
+            self.phases.observe((route, name), seconds)
+        self.bytes.observe((route,), metrics.bytes)
+        self.rows_read.observe((route,), metrics.rows_read)
+        self.rows_scanned.observe((route,), metrics.rows_scanned)
+        self.rows_returned.observe((route,), metrics.rows_returned)
+
+    def render(self):
+        histograms = (self.duration, self.phases, self.bytes, self.rows_read, self.rows_scanned, self.rows_returned)
+        return "\n".join(line for histogram in histograms for line in histogram.render()) + "\n"
@@ -1,7 +1,23 @@
-import duckdb as db
+import argparse
 import time
+import zipfile
+from archive import find_sources
+from extract import stream_to_db, WPL
+from ingest import connect, create_table
 
-def xml_to_db(XML_PATH):
+# Database, table and columns the ingest writes
+DB_PATH = 'mun.db'
+TABLE = "municipalities"
+COLUMNS = """
+  identificatie TEXT,
+  naam TEXT,
+  status TEXT,
+  documentdatum DATE,
+  voorkomenidentificatie INTEGER,
+  geom GEOMETRY
+"""
+
+def xml_to_db(con, TABLE, XML_PATH):
     con.sql(f"""
     INSERT INTO {TABLE}
     WITH docs AS (
@@ -17,6 +33,7 @@ def xml_to_db(XML_PATH):
         xml_extract_text(mun_xml, '//Objecten:naam')[1] AS naam,
         xml_extract_text(mun_xml, '//Objecten:status')[1] AS status,
         TRY_CAST(xml_extract_text(mun_xml, '//Objecten:documentdatum')[1] AS DATE) AS documentdatum,
+        TRY_CAST(xml_extract_text(mun_xml, '//Historie:voorkomenidentificatie')[1] AS INTEGER) AS voorkomenidentificatie,
         TRY_CAST(xml_extract_text(mun_xml, '//gml:Polygon/gml:exterior/gml:LinearRing/gml:posList')[1] AS VARCHAR) AS poslist
       FROM muns_xml
       WHERE xml_extract_text(mun_xml, '//Historie:eindGeldigheid')[1] IS NULL
@@ -26,6 +43,7 @@ def xml_to_db(XML_PATH):
       naam,
       status,
       documentdatum,
+      voorkomenidentificatie,
       ST_GeomFromText(
           'POLYGON((' ||
           array_to_string(
@@ -43,36 +61,36 @@ def xml_to_db(XML_PATH):
         naam,
         status,
         documentdatum,
+        voorkomenidentificatie,
         list_filter(str_split(poslist, ' '), x -> x <> '') AS nums
       FROM extracted
     ) t
     """)
 
+def xml_to_db_stream(con, TABLE, XML_PATH):
+    stream_to_db(con, TABLE, XML_PATH, WPL)
+
 if __name__ == "__main__":
-    con = db.connect('mun.db')
-    con.install_extension("spatial")
-    con.load_extension("spatial")
-    con.execute("INSTALL webbed FROM community")
-    con.load_extension("webbed")
+    parser = argparse.ArgumentParser(description="Ingest the BAG WPL extract into mun.db")
+    parser.add_argument("--extractor", choices=["sql", "stream"], default="stream",
+                        help="sql: read_xml_objects + XPath in DuckDB, stream: single-pass incremental parser")
+    parser.add_argument("--source", default="mun",
+                        help="directory with the extracted files or the (nested) LVBAG delivery zip")
+    args = parser.parse_args()
+
+    if args.extractor == "sql" and zipfile.is_zipfile(args.source):
+        parser.error("the sql extractor needs extracted files, use --extractor stream to read from the zip")
 
-    XML_PATH = 'mun\*.xml'
-    TABLE = "municipalities"
+    extractor = xml_to_db if args.extractor == "sql" else xml_to_db_stream
+
+    con = connect(DB_PATH, args.extractor == "sql")
 
     tic = time.time()
 
-    con.sql(f"DROP TABLE IF EXISTS {TABLE};")
-    con.sql(f"""
-    CREATE TABLE {TABLE} (
-      identificatie TEXT,
-      naam TEXT,
-      status TEXT,
-      documentdatum DATE,
-      geom GEOMETRY
-    );
-    """)
+    create_table(con, TABLE, COLUMNS)
 
-    XML_PATH = 'mun\9999WPL08122025-000001.xml'
-    xml_to_db(XML_PATH)
+    for XML_PATH in find_sources(args.source, '*WPL*.xml', zips='*WPL*.zip'):
+        extractor(con, TABLE, XML_PATH)
 
     tac = time.time()
 
@@ -0,0 +1,120 @@
+import argparse
+import time
+import pyarrow as pa
+from archive import find_sources, open_source
+from extract import arrow_schema, iter_batches, PND, VBO, WPL
+from ingest import connect
+
+# Database, table, object schema and mutation file pattern per collection
+COLLECTIONS = {
+    "panden": ("bag.db", "panden", PND, "*PND*.xml"),
+    "verblijfsobjecten": ("vbo.db", "verblijfsobjecten", VBO, "*VBO*.xml"),
+    "woonplaatsen": ("mun.db", "municipalities", WPL, "*WPL*.xml"),
+}
+
+def create_mutation_log(con, TABLE):
+    # Extents touched by applied mutations, so the export only has to regenerate the partitions that changed
+    con.sql(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE}_mutaties (
+      identificatie TEXT,
+      minx DOUBLE,
+      miny DOUBLE,
+      maxx DOUBLE,
+      maxy DOUBLE,
+      applied TIMESTAMP
+    );
+    """)
+
+def apply_mutations(con, TABLE, XML_PATH, SCHEMA):
+    # One transaction per file: a file that fails halfway leaves the table as it was
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        changes = apply_file(con, TABLE, XML_PATH, SCHEMA)
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+    con.execute("COMMIT;")
+    return changes
+
+def apply_file(con, TABLE, XML_PATH, SCHEMA):
+    with open_source(XML_PATH) as f:
+        reader = pa.RecordBatchReader.from_batches(arrow_schema(SCHEMA, mutations=True), iter_batches(f, SCHEMA, mutations=True))
+        con.register("xml_batches", reader)
+        con.execute("CREATE OR REPLACE TEMP TABLE mutaties AS SELECT * FROM xml_batches;")
+        con.unregister("xml_batches")
+
+    # The newest state of every object in the file: the newest voorkomen, of two states of the same voorkomen (a
+    # correction) the one further down the file. Only what it adds or changes counts ('wordt', also outside a was /
+    # wordt element), and what it only ends ('was' with an eindGeldigheid and no new state).
+    con.execute("""
+    CREATE OR REPLACE TEMP TABLE laatste AS
+    SELECT * FROM mutaties
+    WHERE coalesce(mutatie, 'wordt') = 'wordt' OR eindGeldigheid IS NOT NULL
+    QUALIFY row_number() OVER (
+      PARTITION BY identificatie
+      ORDER BY TRY_CAST(voorkomenidentificatie AS INTEGER) DESC NULLS LAST, volgnummer::INTEGER DESC
+    ) = 1;
+    """)
+
+    # The objects a file changes. A correction of a voorkomen older than the one in the table (of an ended,
+    # historic voorkomen) leaves the current object alone.
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE gewijzigd AS
+    SELECT identificatie FROM laatste
+    WHERE NOT EXISTS (
+      SELECT 1 FROM {TABLE}
+      WHERE {TABLE}.identificatie = laatste.identificatie
+        AND {TABLE}.voorkomenidentificatie > TRY_CAST(laatste.voorkomenidentificatie AS INTEGER)
+    );
+    """)
+
+    # Their new state. Objects whose newest state has an eindGeldigheid have ended and get no row here, so they
+    # are only deleted.
+    con.execute("""
+    CREATE OR REPLACE TEMP TABLE actueel AS
+    SELECT * FROM laatste
+    WHERE identificatie IN (SELECT identificatie FROM gewijzigd) AND eindGeldigheid IS NULL;
+    """)
+
+    # Log the old and the new extent of every touched object
+    con.execute(f"""
+    INSERT INTO {TABLE}_mutaties
+    SELECT identificatie, ST_XMin(geom), ST_YMin(geom), ST_XMax(geom), ST_YMax(geom), now()
+    FROM {TABLE}
+    WHERE identificatie IN (SELECT identificatie FROM gewijzigd)
+    UNION ALL
+    SELECT identificatie, ST_XMin(g), ST_YMin(g), ST_XMax(g), ST_YMax(g), now()
+    FROM (SELECT identificatie, ST_GeomFromWKB(geom) AS g FROM actueel);
+    """)
+
+    # Upsert keyed on identificatie: drop every current row of a touched object, then add its valid version
+    con.execute(f"DELETE FROM {TABLE} WHERE identificatie IN (SELECT identificatie FROM gewijzigd);")
+    con.execute(f"INSERT INTO {TABLE} SELECT {SCHEMA['select']} FROM actueel;")
+
+    return con.execute("SELECT COUNT(*) FROM gewijzigd;").fetchone()[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply BAG daily mutation files to an ingested collection")
+    parser.add_argument("collection", choices=list(COLLECTIONS))
+    parser.add_argument("sources", nargs="+",
+                        help="mutation zips (nested zips are searched) or directories with mutation files, applied in order")
+    args = parser.parse_args()
+
+    DB_PATH, TABLE, SCHEMA, pattern = COLLECTIONS[args.collection]
+
+    files = [f for SOURCE in args.sources for f in find_sources(SOURCE, pattern)]
+
+    con = connect(DB_PATH, webbed=False)
+    create_mutation_log(con, TABLE)
+
+    tic = time.time()
+
+    for XML_PATH in files:
+        changes = apply_mutations(con, TABLE, XML_PATH, SCHEMA)
+        print(XML_PATH, "-", changes, "objects changed")
+
+    tac = time.time()
+
+    print("time:", (tac - tic), "s")
+
+    con.close()
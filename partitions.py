@@ -0,0 +1,74 @@
+import json
+import os
+from functools import lru_cache
+
+# A partitioned collection is written next to its monolithic file: 'bag.parquet' ->
+# 'bag_partitions/<tile_x>_<tile_y>.parquet' plus 'bag_partitions/manifest.json' with the extent and row count of
+# every partition. The suffix keeps it apart from the input directories of the ingest ('vbo/' for vbo.parquet).
+
+def partition_dir(output):
+    return os.path.splitext(output)[0] + "_partitions"
+
+def manifest_path(output):
+    return os.path.join(partition_dir(output), "manifest.json")
+
+def index_path(output, key="identificatie"):
+    # Sidecar with the file and Hilbert key of every object by key: 'bag.parquet' -> 'bag_index.parquet' for
+    # identificatie, 'vbo.parquet' -> 'vbo_pand_index.parquet' for pand
+    if key == "identificatie":
+        return os.path.splitext(output)[0] + "_index.parquet"
+    return f"{os.path.splitext(output)[0]}_{key}_index.parquet"
+
+@lru_cache(maxsize=16)
+def read_manifest(path, mtime):
+    with open(path) as f:
+        return json.load(f)
+
+def load_manifest(output):
+    # The manifest is re-read only when the export rewrote it
+    path = manifest_path(output)
+    if not os.path.exists(path):
+        return None
+    return read_manifest(path, os.path.getmtime(path))
+
+def data_version(output):
+    # Changes whenever the export rewrites the collection: the manifest of the partitions, else the file itself
+    path = manifest_path(output)
+    if not os.path.exists(path):
+        path = output
+    if not os.path.exists(path):
+        return "missing"
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def write_manifest(output, manifest):
+    path = manifest_path(output)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def data_files(output):
+    # The files a collection is read from: its partitions if it has a manifest, else the monolithic file
+    manifest = load_manifest(output)
+    if manifest is None or not manifest["partitions"]:
+        return [output]
+    return [os.path.join(partition_dir(output), p["path"]) for p in manifest["partitions"]]
+
+def intersects(bbox, box):
+    return bbox[0] <= box[2] and bbox[2] >= box[0] and bbox[1] <= box[3] and bbox[3] >= box[1]
+
+def source(output, boxes=()):
+    # SQL relation for a collection, reading only the partitions whose extent intersects all of the given boxes
+    # (minx, miny, maxx, maxy). Without a manifest the monolithic file is read.
+    manifest = load_manifest(output)
+    if manifest is None or not manifest["partitions"]:
+        return f"'{output}'"
+
+    directory = partition_dir(output)
+    partitions = [p for p in manifest["partitions"] if all(intersects(p["bbox"], box) for box in boxes)]
+    if not partitions:
+        # Nothing can match, but the relation still needs the columns of the collection
+        return f"(SELECT * FROM '{os.path.join(directory, manifest['partitions'][0]['path'])}' LIMIT 0)"
+
+    files = ", ".join(f"'{os.path.join(directory, p['path'])}'" for p in partitions)
+    return f"read_parquet([{files}])"
@@ -0,0 +1,54 @@
+import os
+import queue
+from contextlib import contextmanager
+import duckdb
+
+def load_spatial(db, path=None):
+    # From a bundled extension file when given, else the installed extension. Only when it was never installed is
+    # it downloaded, so a server with the extension in its image starts without network access.
+    if path:
+        db.execute(f"LOAD '{path}'")
+        return
+    try:
+        db.execute("LOAD spatial")
+    except duckdb.IOException:
+        db.execute("INSTALL spatial")
+        db.execute("LOAD spatial")
+
+class CursorPool:
+    # A fixed set of cursors on one DuckDB database. Every request borrows a cursor of its own, so concurrent
+    # handlers run their queries side by side instead of queueing on (or corrupting) one shared connection.
+    def __init__(self, size, threads=None, memory_limit=None, spatial=None):
+        self.db = duckdb.connect()
+        load_spatial(self.db, spatial)
+        # Parquet footers are read once per file instead of by every query; a rewritten file is read again
+        self.db.execute("SET parquet_metadata_cache = true")
+        # threads and memory_limit hold for the whole database, so for all cursors of this pool together
+        if threads:
+            self.db.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            self.db.execute(f"SET memory_limit = '{memory_limit}'")
+
+        self.cursors = queue.Queue()
+        for _ in range(size):
+            cur = self.db.cursor()
+            # Keeps the profile of the last query of every cursor, for the rows read and scanned per request (metrics.py)
+            cur.execute("SET enable_profiling = 'no_output'")
+            self.cursors.put(cur)
+
+    @contextmanager
+    def cursor(self):
+        # Blocks (in the worker thread of the request, not the event loop) until a cursor is free
+        cur = self.cursors.get()
+        try:
+            yield cur
+        finally:
+            self.cursors.put(cur)
+
+def from_env():
+    return CursorPool(
+        size=int(os.environ.get("BAG_POOL_SIZE", os.cpu_count() or 4)),
+        threads=os.environ.get("BAG_DUCKDB_THREADS"),
+        memory_limit=os.environ.get("BAG_DUCKDB_MEMORY_LIMIT"),
+        spatial=os.environ.get("BAG_SPATIAL_EXTENSION"),
+    )
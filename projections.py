@@ -0,0 +1,26 @@
+# The CRS of the BAG and the CRSs the API serves. The export can store the geometries in the other CRSs as well,
+# as a column per CRS next to the RD New one (db_to_parquet.py --crs); without it the API transforms per request.
+CRS = "EPSG:28992"
+SUPPORTED = ("EPSG:28992", "EPSG:4326", "EPSG:3857")
+
+def crs_column(crs, column="geom"):
+    # geom -> geom_4326
+    return column if crs == CRS else f"{column}_{crs.split(':')[1]}"
+
+def column_crs(column):
+    # The CRS of a stored geometry column
+    for crs in SUPPORTED:
+        if crs != CRS and column.endswith(crs_column(crs, "")):
+            return crs
+    return CRS
+
+def transform(expression, crs):
+    # Longitude, latitude order (as GeoJSON and web maps expect), whatever the axis order of the CRS definition
+    if crs == CRS:
+        return expression
+    return f"ST_Transform({expression}, '{CRS}', '{crs}', always_xy := true)"
+
+def crs_label(crs):
+    # The CRS to label output geometries with. Transformed coordinates are longitude, latitude, which is
+    # OGC:CRS84 rather than EPSG:4326 (latitude, longitude by definition).
+    return "OGC:CRS84" if crs == "EPSG:4326" else crs
@@ -0,0 +1,277 @@
+import argparse
+import math
+import os
+import random
+import time
+from datetime import date, timedelta
+import duckdb as db
+from extract import NS
+
+# Synthetic LVBAG extract: PND, VBO and WPL files in the schema of the real delivery (stand files of
+# objects with their voorkomens), laid out the way the ingest scripts read them by default (data/, vbo/, mun/),
+# and PC4 areas in cbs_pc4.gpkg for the export. Panden are clustered in towns of very different sizes, so
+# bbox queries see both empty countryside and dense city centres, as they do at national scale.
+
+# Area the towns are placed in (RD New, roughly the Netherlands)
+EXTENT = (13000, 306000, 278000, 619000)
+
+# Size in metres of the square woonplaatsen and PC4 areas the extent is divided into
+WOONPLAATS_SIZE = 10000
+POSTCODE_SIZE = 5000
+
+# Objects per file, as in the national extract
+OBJECTS_PER_FILE = 10000
+
+# Date in the file names (9999PND01012025-000001.xml)
+DELIVERY = "01012025"
+
+PAND_STATUS = {
+    "Pand in gebruik": 0.85,
+    "Pand in gebruik (niet ingemeten)": 0.05,
+    "Bouw gestart": 0.03,
+    "Bouwvergunning verleend": 0.03,
+    "Pand buiten gebruik": 0.02,
+    "Sloopvergunning verleend": 0.02,
+}
+VBO_STATUS = {
+    "Verblijfsobject in gebruik": 0.9,
+    "Verblijfsobject in gebruik (niet ingemeten)": 0.04,
+    "Verblijfsobject gevormd": 0.03,
+    "Verblijfsobject buiten gebruik": 0.03,
+}
+GEBRUIKSDOEL = {
+    "woonfunctie": 0.75,
+    "industriefunctie": 0.06,
+    "kantoorfunctie": 0.05,
+    "winkelfunctie": 0.04,
+    "overige gebruiksfunctie": 0.03,
+    "bijeenkomstfunctie": 0.02,
+    "logiesfunctie": 0.015,
+    "onderwijsfunctie": 0.01,
+    "gezondheidszorgfunctie": 0.01,
+    "sportfunctie": 0.01,
+    "celfunctie": 0.005,
+}
+# Verblijfsobjecten per pand: sheds and garages have none, apartment blocks many
+VBO_COUNT = {0: 0.2, 1: 0.6, 2: 0.08, 3: 0.05, 4: 0.03, 12: 0.02, 40: 0.02}
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<sl-bag-extract:bagStand xmlns:sl-bag-extract="http://www.kadaster.nl/schemas/lvbag/extract-deelbestand-lvc/v20200601" xmlns:sl="http://www.kadaster.nl/schemas/standlevering-generiek/1.0" xmlns:Objecten="{Objecten}" xmlns:Objecten-ref="{Objecten-ref}" xmlns:Historie="{Historie}" xmlns:gml="{gml}">
+<sl:standBestand>
+<sl:dataset>LVBAG</sl:dataset>
+<sl:inhoud><sl:gebied>NLD</sl:gebied><sl:leveringsId>9999</sl:leveringsId><sl:objectTypen><sl:objectType>{object_type}</sl:objectType></sl:objectTypen></sl:inhoud>
+<sl:stand>
+"""
+FOOTER = """</sl:stand>
+</sl:standBestand>
+</sl-bag-extract:bagStand>
+"""
+
+SRS = 'srsName="urn:ogc:def:crs:EPSG::28992"'
+
+def pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+def some_date(rng, start=date(1990, 1, 1), days=12400):
+    return start + timedelta(days=rng.randrange(days))
+
+def voorkomen(number, begin, end=None):
+    end = f"<Historie:eindGeldigheid>{end}</Historie:eindGeldigheid>" if end else ""
+    return (f"<Objecten:voorkomen><Historie:Voorkomen>"
+            f"<Historie:voorkomenidentificatie>{number}</Historie:voorkomenidentificatie>"
+            f"<Historie:beginGeldigheid>{begin}</Historie:beginGeldigheid>{end}"
+            f"<Historie:tijdstipRegistratie>{begin}T09:00:00.000</Historie:tijdstipRegistratie>"
+            f"<Historie:BeschikbaarLV><Historie:tijdstipRegistratieLV>{begin}T09:00:01.000</Historie:tijdstipRegistratieLV></Historie:BeschikbaarLV>"
+            f"</Historie:Voorkomen></Objecten:voorkomen>")
+
+def pand_xml(identificatie, ring, bouwjaar, status, documentdatum, history):
+    poslist = " ".join(f"{x:.3f} {y:.3f} 0.0" for x, y in ring)
+    return (f"<sl-bag-extract:bagObject><Objecten:Pand>"
+            f"<Objecten:identificatie domein=\"NL.IMBAG.Pand\">{identificatie}</Objecten:identificatie>"
+            f"<Objecten:geometrie><gml:Polygon {SRS} srsDimension=\"3\"><gml:exterior><gml:LinearRing>"
+            f"<gml:posList count=\"{len(ring)}\">{poslist}</gml:posList>"
+            f"</gml:LinearRing></gml:exterior></gml:Polygon></Objecten:geometrie>"
+            f"<Objecten:oorspronkelijkBouwjaar>{bouwjaar}</Objecten:oorspronkelijkBouwjaar>"
+            f"<Objecten:status>{status}</Objecten:status>"
+            f"<Objecten:geconstateerd>N</Objecten:geconstateerd>"
+            f"<Objecten:documentdatum>{documentdatum}</Objecten:documentdatum>"
+            f"<Objecten:documentnummer>{identificatie[:4]}-{documentdatum}</Objecten:documentnummer>"
+            f"{history}"
+            f"</Objecten:Pand></sl-bag-extract:bagObject>\n")
+
+def vbo_xml(identificatie, point, gebruiksdoel, oppervlakte, status, documentdatum, pand, hoofdadres, history):
+    return (f"<sl-bag-extract:bagObject><Objecten:Verblijfsobject>"
+            f"<Objecten:heeftAlsHoofdadres><Objecten-ref:NummeraanduidingRef domein=\"NL.IMBAG.Nummeraanduiding\">{hoofdadres}</Objecten-ref:NummeraanduidingRef></Objecten:heeftAlsHoofdadres>"
+            f"{history}"
+            f"<Objecten:identificatie domein=\"NL.IMBAG.Verblijfsobject\">{identificatie}</Objecten:identificatie>"
+            f"<Objecten:geometrie><Objecten:punt><gml:Point {SRS} srsDimension=\"3\">"
+            f"<gml:pos>{point[0]:.3f} {point[1]:.3f} 0.0</gml:pos></gml:Point></Objecten:punt></Objecten:geometrie>"
+            f"<Objecten:gebruiksdoel>{gebruiksdoel}</Objecten:gebruiksdoel>"
+            f"<Objecten:oppervlakte>{oppervlakte}</Objecten:oppervlakte>"
+            f"<Objecten:status>{status}</Objecten:status>"
+            f"<Objecten:geconstateerd>N</Objecten:geconstateerd>"
+            f"<Objecten:documentdatum>{documentdatum}</Objecten:documentdatum>"
+            f"<Objecten:documentnummer>{identificatie[:4]}-{documentdatum}</Objecten:documentnummer>"
+            f"<Objecten:maaktDeelUitVan><Objecten-ref:PandRef domein=\"NL.IMBAG.Pand\">{pand}</Objecten-ref:PandRef></Objecten:maaktDeelUitVan>"
+            f"</Objecten:Verblijfsobject></sl-bag-extract:bagObject>\n")
+
+def woonplaats_xml(identificatie, naam, ring, documentdatum):
+    poslist = " ".join(f"{x:.3f} {y:.3f}" for x, y in ring)
+    return (f"<sl-bag-extract:bagObject><Objecten:Woonplaats>"
+            f"<Objecten:identificatie domein=\"NL.IMBAG.Woonplaats\">{identificatie}</Objecten:identificatie>"
+            f"<Objecten:naam>{naam}</Objecten:naam>"
+            f"<Objecten:geometrie><Objecten:vlak><gml:Polygon {SRS} srsDimension=\"2\"><gml:exterior><gml:LinearRing>"
+            f"<gml:posList count=\"{len(ring)}\">{poslist}</gml:posList>"
+            f"</gml:LinearRing></gml:exterior></gml:Polygon></Objecten:vlak></Objecten:geometrie>"
+            f"<Objecten:status>Woonplaats aangewezen</Objecten:status>"
+            f"<Objecten:geconstateerd>N</Objecten:geconstateerd>"
+            f"<Objecten:documentdatum>{documentdatum}</Objecten:documentdatum>"
+            f"<Objecten:documentnummer>WPL-{identificatie}</Objecten:documentnummer>"
+            f"{voorkomen(1, documentdatum)}"
+            f"</Objecten:Woonplaats></sl-bag-extract:bagObject>\n")
+
+class Files:
+    # Writes objects to numbered files of objects_per_file objects each: <directory>/9999PND01012025-000001.xml
+    def __init__(self, directory, object_type, objects_per_file):
+        self.directory = directory
+        self.object_type = object_type
+        self.objects_per_file = objects_per_file
+        self.f = None
+        self.count = 0
+        self.files = 0
+        self.objects = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, xml):
+        if self.f is None or self.count == self.objects_per_file:
+            self.close()
+            self.files += 1
+            path = os.path.join(self.directory, f"9999{self.object_type}{DELIVERY}-{self.files:06d}.xml")
+            self.f = open(path, "w", encoding="utf-8")
+            self.f.write(HEADER.format(object_type=self.object_type, **NS))
+            self.count = 0
+        self.f.write(xml)
+        self.count += 1
+        self.objects += 1
+
+    def close(self):
+        if self.f is not None:
+            self.f.write(FOOTER)
+            self.f.close()
+            self.f = None
+
+def rectangle(x, y, width, depth, angle):
+    # Closed ring of a rotated rectangle centred on x, y
+    cos, sin = math.cos(angle), math.sin(angle)
+    corners = [(-width / 2, -depth / 2), (width / 2, -depth / 2), (width / 2, depth / 2), (-width / 2, depth / 2)]
+    ring = [(x + dx * cos - dy * sin, y + dx * sin + dy * cos) for dx, dy in corners]
+    return ring + ring[:1]
+
+def towns(rng, panden):
+    # Town centres with their share of the panden (a few big cities, many villages) and spread in metres
+    n = max(1, panden // 2000)
+    sizes = [1 / rank for rank in range(1, n + 1)]
+    return [
+        (rng.uniform(EXTENT[0] + 5000, EXTENT[2] - 5000), rng.uniform(EXTENT[1] + 5000, EXTENT[3] - 5000),
+         size, 300 + 4000 * math.sqrt(size))
+        for size in sizes
+    ]
+
+def generate(output, panden, seed=1, objects_per_file=OBJECTS_PER_FILE, history=0.1):
+    # Write the extract under output. history is the fraction of objects that also get an ended (earlier)
+    # voorkomen, which the ingest has to skip.
+    rng = random.Random(seed)
+    tic = time.time()
+
+    pnd = Files(os.path.join(output, "data"), "PND", objects_per_file)
+    vbo = Files(os.path.join(output, "vbo"), "VBO", objects_per_file)
+    wpl = Files(os.path.join(output, "mun"), "WPL", objects_per_file)
+
+    centres = towns(rng, panden)
+    weights = [town[2] for town in centres]
+    vbo_serial = 0
+    for serial in range(1, panden + 1):
+        cx, cy, _, spread = rng.choices(centres, weights=weights)[0]
+        x = min(max(rng.gauss(cx, spread), EXTENT[0]), EXTENT[2])
+        y = min(max(rng.gauss(cy, spread), EXTENT[1]), EXTENT[3])
+        width, depth, angle = rng.uniform(5, 25), rng.uniform(5, 25), rng.uniform(0, math.pi)
+
+        identificatie = f"9999100{serial:09d}"
+        bouwjaar = max(1200, int(2025 - rng.expovariate(1 / 50)))
+        documentdatum = some_date(rng)
+        if rng.random() < history:
+            begin = documentdatum - timedelta(days=rng.randrange(1, 3000))
+            pnd.write(pand_xml(identificatie, rectangle(x, y, width * 0.8, depth, angle), bouwjaar,
+                               "Bouw gestart", begin, voorkomen(1, begin, documentdatum)))
+            pand_history = voorkomen(2, documentdatum)
+        else:
+            pand_history = voorkomen(1, documentdatum)
+        pnd.write(pand_xml(identificatie, rectangle(x, y, width, depth, angle), bouwjaar,
+                           pick(rng, PAND_STATUS), documentdatum, pand_history))
+
+        for _ in range(pick(rng, VBO_COUNT)):
+            vbo_serial += 1
+            vbo_id = f"9999010{vbo_serial:09d}"
+            # A point inside the footprint
+            dx, dy = rng.uniform(-0.4, 0.4) * width, rng.uniform(-0.4, 0.4) * depth
+            point = (x + dx * math.cos(angle) - dy * math.sin(angle), y + dx * math.sin(angle) + dy * math.cos(angle))
+            vbo_date = documentdatum + timedelta(days=rng.randrange(0, 365))
+            hoofdadres = f"9999200{vbo_serial:09d}"
+            oppervlakte = int(rng.lognormvariate(4.4, 0.6)) + 1
+            if rng.random() < history:
+                vbo.write(vbo_xml(vbo_id, point, "woonfunctie", oppervlakte, "Verblijfsobject gevormd", documentdatum,
+                                  identificatie, hoofdadres, voorkomen(1, documentdatum, vbo_date)))
+                vbo_history = voorkomen(2, vbo_date)
+            else:
+                vbo_history = voorkomen(1, vbo_date)
+            vbo.write(vbo_xml(vbo_id, point, pick(rng, GEBRUIKSDOEL), oppervlakte, pick(rng, VBO_STATUS), vbo_date,
+                              identificatie, hoofdadres, vbo_history))
+
+    # Woonplaatsen are the squares of a grid over the extent
+    number = 0
+    for x in range(EXTENT[0], EXTENT[2], WOONPLAATS_SIZE):
+        for y in range(EXTENT[1], EXTENT[3], WOONPLAATS_SIZE):
+            number += 1
+            ring = rectangle(x + WOONPLAATS_SIZE / 2, y + WOONPLAATS_SIZE / 2, WOONPLAATS_SIZE, WOONPLAATS_SIZE, 0)
+            wpl.write(woonplaats_xml(f"{1000 + number:04d}", f"Woonplaats {number}", ring, some_date(rng)))
+
+    for files in (pnd, vbo, wpl):
+        files.close()
+
+    # PC4 areas, in the file and with the column db_to_parquet.py reads them from
+    path = os.path.join(output, "cbs_pc4.gpkg")
+    if os.path.exists(path):
+        os.remove(path)
+    con = db.connect()
+    con.install_extension("spatial")
+    con.load_extension("spatial")
+    con.execute(f"""
+        COPY (
+            SELECT (999 + row_number() OVER (ORDER BY y, x))::VARCHAR AS postcode,
+                   ST_MakeEnvelope(x, y, x + {POSTCODE_SIZE}, y + {POSTCODE_SIZE}) AS geom
+            FROM range({EXTENT[0]}, {EXTENT[2]}, {POSTCODE_SIZE}) AS xs(x),
+                 range({EXTENT[1]}, {EXTENT[3]}, {POSTCODE_SIZE}) AS ys(y)
+        ) TO '{path}' (FORMAT GDAL, DRIVER 'GPKG', SRS 'EPSG:28992');
+    """)
+    con.close()
+
+    return {
+        "seed": seed,
+        "towns": len(centres),
+        "seconds": time.time() - tic,
+        "objects": {files.object_type: files.objects for files in (pnd, vbo, wpl)},
+        "files": {files.object_type: files.files for files in (pnd, vbo, wpl)},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic LVBAG extract (PND, VBO, WPL) and PC4 areas")
+    parser.add_argument("--panden", type=int, default=100000, help="number of panden (verblijfsobjecten scale with it)")
+    parser.add_argument("--seed", type=int, default=1, help="the same seed writes the same extract")
+    parser.add_argument("--objects-per-file", type=int, default=OBJECTS_PER_FILE)
+    parser.add_argument("--history", type=float, default=0.1,
+                        help="fraction of objects that also have an ended voorkomen")
+    parser.add_argument("--output", default=".", help="directory to write data/, vbo/, mun/ and cbs_pc4.gpkg in")
+    args = parser.parse_args()
+
+    stats = generate(args.output, args.panden, args.seed, args.objects_per_file, args.history)
+    print(stats)
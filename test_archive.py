@@ -0,0 +1,35 @@
+import zipfile
+import pytest
+import archive
+from archive import find_sources, open_source
+
+@pytest.fixture
+def delivery(tmp_path):
+    # A delivery zip with a deflated and a stored zip of XML files inside
+    members = {f"9999PND01012025-{i:06d}.xml": f"<pand>{i}</pand>".encode() * 100 for i in range(1, 21)}
+    outer = tmp_path / "lvbag-extract-nl.zip"
+    with zipfile.ZipFile(outer, "w", zipfile.ZIP_STORED) as z:
+        for name, compression in (("9999PND01012025.zip", zipfile.ZIP_DEFLATED), ("9999VBO01012025.zip", zipfile.ZIP_STORED)):
+            inner = tmp_path / name
+            with zipfile.ZipFile(inner, "w", compression) as zi:
+                for member, data in members.items():
+                    zi.writestr(member.replace("PND", name[4:7]), data)
+            z.write(inner, name, compress_type=compression)
+    yield str(outer), members
+    archive.remove_extracted()
+
+def test_members_of_nested_archives(delivery, monkeypatch):
+    outer, members = delivery
+    opened = []
+    open_member = zipfile.ZipFile.open
+    monkeypatch.setattr(zipfile.ZipFile, "open", lambda z, name, *a, **kw: opened.append(name) or open_member(z, name, *a, **kw))
+
+    refs = find_sources(outer, "*PND*.xml", zips="*PND*.zip") + find_sources(outer, "*VBO*.xml", zips="*VBO*.zip")
+    assert len(refs) == 2 * len(members)
+    for ref in refs:
+        with open_source(ref) as f:
+            assert f.read() == members[ref.rsplit("!", 1)[1].replace("VBO", "PND")]
+
+    # The deflated archive is decompressed once, not once per member
+    assert opened.count("9999PND01012025.zip") == 1
+    assert "9999VBO01012025.zip" not in opened
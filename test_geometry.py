@@ -0,0 +1,54 @@
+import random
+import struct
+import numpy as np
+import pytest
+from geometry import WKB_MULTIPOLYGON, WKB_POINT, WKB_POLYGON, to_wkb
+
+# The per-geometry builder to_wkb replaced, as the reference for its output
+def reference_ring(text, stride):
+    coords = np.array([float(value) for value in text.split()]).reshape(-1, stride)[:, :2]
+    return struct.pack("<I", len(coords)) + b"".join(struct.pack("<dd", x, y) for x, y in coords)
+
+def reference_polygon(rings):
+    return struct.pack("<BII", 1, WKB_POLYGON, len(rings)) + b"".join(reference_ring(*ring) for ring in rings)
+
+def reference_wkb(geometry, kind):
+    if geometry is None:
+        return None
+    if kind == "point":
+        text, stride = geometry[0][0]
+        return struct.pack("<BI", 1, WKB_POINT) + reference_ring(text, stride)[4:20]
+    if len(geometry) == 1:
+        return reference_polygon(geometry[0])
+    return struct.pack("<BII", 1, WKB_MULTIPOLYGON, len(geometry)) + b"".join(reference_polygon(rings) for rings in geometry)
+
+def ring(rng, stride, points):
+    # posList text as in the extracts, with the odd extra whitespace
+    values = [f"{rng.uniform(0, 300000):.3f}" for _ in range(points * stride)]
+    return ("  ".join(values) if rng.random() < 0.2 else " ".join(values), stride)
+
+def polygon_geometry(rng):
+    # Exterior and interior rings, 2D (woonplaatsen) or 3D (panden), sometimes several polygons (a MultiSurface)
+    if rng.random() < 0.1:
+        return None
+    stride = rng.choice([2, 3])
+    return [[ring(rng, stride, rng.randint(4, 12)) for _ in range(rng.choice([1, 1, 2, 3]))]
+            for _ in range(rng.choice([1, 1, 1, 2, 4]))]
+
+def point_geometry(rng):
+    if rng.random() < 0.1:
+        return None
+    return [[ring(rng, rng.choice([2, 3]), 1)]]
+
+@pytest.mark.parametrize("kind, make", [("polygon", polygon_geometry), ("point", point_geometry)])
+@pytest.mark.parametrize("size", [0, 1, 2, 500])
+def test_same_wkb_as_the_per_geometry_builder(kind, make, size):
+    rng = random.Random(size)
+    geometries = [make(rng) for _ in range(size)]
+    assert to_wkb(geometries, kind).to_pylist() == [reference_wkb(geometry, kind) for geometry in geometries]
+
+def test_mixed_strides_and_interior_rings():
+    exterior = ("0 0 1 10 0 1 10 10 1 0 10 1 0 0 1", 3)
+    hole = ("2 2 4 2 4 4 2 2", 2)
+    geometries = [[[exterior, hole]], [[exterior], [hole, hole]], None]
+    assert to_wkb(geometries, "polygon").to_pylist() == [reference_wkb(geometry, "polygon") for geometry in geometries]
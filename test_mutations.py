@@ -0,0 +1,87 @@
+import duckdb
+import pytest
+from extract import NS, PND
+from ingest import create_table
+from main import COLUMNS, TABLE
+from mutations import apply_mutations, create_mutation_log
+from synthetic import FOOTER, HEADER, pand_xml, voorkomen
+
+MUTATIONS = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<ml:bagMutaties xmlns:ml="http://www.kadaster.nl/schemas/lvbag/extract-deelbestand-mutaties-lvc/v20200601" '
+             'xmlns:sl-bag-extract="http://www.kadaster.nl/schemas/lvbag/extract-deelbestand-lvc/v20200601" '
+             'xmlns:Objecten="{Objecten}" xmlns:Objecten-ref="{Objecten-ref}" xmlns:Historie="{Historie}" xmlns:gml="{gml}">\n'
+             '{body}</ml:bagMutaties>\n')
+
+def pand(identificatie, number, status="Pand in gebruik", end=None):
+    ring = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]
+    return pand_xml(identificatie, ring, 2000, status, "2020-01-01", voorkomen(number, "2020-01-01", end))
+
+def wijziging(was, wordt):
+    return f"<ml:mutatieGroep><ml:wijziging><ml:was>{was}</ml:was><ml:wordt>{wordt}</ml:wordt></ml:wijziging></ml:mutatieGroep>\n"
+
+def toevoeging(wordt):
+    return f"<ml:mutatieGroep><ml:toevoeging><ml:wordt>{wordt}</ml:wordt></ml:toevoeging></ml:mutatieGroep>\n"
+
+def only_was(was):
+    return f"<ml:mutatieGroep><ml:wijziging><ml:was>{was}</ml:was></ml:wijziging></ml:mutatieGroep>\n"
+
+@pytest.fixture
+def con(tmp_path):
+    con = duckdb.connect(str(tmp_path / "bag.db"))
+    con.load_extension("spatial")
+    create_table(con, TABLE, COLUMNS)
+    create_mutation_log(con, TABLE)
+    # A stand file has no was / wordt elements; all of it is the new state
+    stand = tmp_path / "stand.xml"
+    stand.write_text(HEADER.format(object_type="PND", **NS)
+                     + "".join(pand(identificatie, 1) for identificatie in "ABCD") + FOOTER)
+    apply_mutations(con, TABLE, str(stand), PND)
+    yield con
+    con.close()
+
+def current(con):
+    return dict(con.execute(f"SELECT identificatie, status FROM {TABLE};").fetchall())
+
+def test_was_and_wordt(con, tmp_path):
+    path = tmp_path / "mutaties.xml"
+    path.write_text(MUTATIONS.format(**NS, body="".join([
+        # A correction of the same voorkomen, twice: the last one in the file counts
+        wijziging(pand("A", 1), pand("A", 1, "Verbouwing pand")),
+        wijziging(pand("A", 1, "Verbouwing pand"), pand("A", 1, "Pand buiten gebruik")),
+        # The new state ends the object: it must not come back in its old state
+        wijziging(pand("B", 1), pand("B", 1, end="2024-01-01")),
+        # Only the old state, now ended
+        only_was(pand("C", 1, end="2024-01-01")),
+        toevoeging(pand("E", 1, "Bouw gestart")),
+    ])))
+
+    assert apply_mutations(con, TABLE, str(path), PND) == 4
+    assert current(con) == {"A": "Pand buiten gebruik", "D": "Pand in gebruik", "E": "Bouw gestart"}
+
+def test_failed_file_is_rolled_back(con, tmp_path):
+    path = tmp_path / "broken.xml"
+    path.write_text(MUTATIONS.format(**NS, body=toevoeging(pand("E", 1)) + "<ml:mutatieGroep>"))
+
+    before = current(con)
+    with pytest.raises(Exception):
+        apply_mutations(con, TABLE, str(path), PND)
+    assert current(con) == before
+    # No transaction was left open
+    con.execute("BEGIN TRANSACTION;")
+    con.execute("ROLLBACK;")
+
+def test_correction_of_a_historic_voorkomen(con, tmp_path):
+    # A in its second voorkomen; the first one has ended
+    stand = tmp_path / "stand_2.xml"
+    stand.write_text(HEADER.format(object_type="PND", **NS)
+                     + pand("A", 1, "Bouw gestart", end="2022-01-01") + pand("A", 2) + FOOTER)
+    apply_mutations(con, TABLE, str(stand), PND)
+    assert current(con)["A"] == "Pand in gebruik"
+
+    # Correcting the ended voorkomen 1 must leave the current voorkomen 2 in place
+    path = tmp_path / "mutaties.xml"
+    path.write_text(MUTATIONS.format(**NS, body=wijziging(pand("A", 1, "Bouw gestart", end="2022-01-01"),
+                                                          pand("A", 1, "Sloopvergunning verleend", end="2022-01-01"))))
+    assert apply_mutations(con, TABLE, str(path), PND) == 0
+    assert current(con)["A"] == "Pand in gebruik"
+    assert con.execute(f"SELECT voorkomenidentificatie FROM {TABLE} WHERE identificatie = 'A';").fetchall() == [(2,)]
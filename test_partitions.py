@@ -0,0 +1,70 @@
+import os
+import duckdb
+import pytest
+from db_to_parquet import attach, export_collection, export_partitioned
+from partitions import data_files, data_version, partition_dir, source
+
+# A collection without computed columns, so only the layout of the export is under test
+CONFIG = {"db": "src.db", "table": "panden", "output": "bag.parquet", "partitioned": True}
+
+@pytest.fixture
+def con(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src = duckdb.connect("src.db")
+    src.load_extension("spatial")
+    src.execute("""
+        CREATE TABLE panden AS
+        SELECT i::VARCHAR AS identificatie, ST_Buffer(ST_Point(100000 + (i % 10) * 1000, 450000 + (i // 10) * 1000), 5) AS geom
+        FROM range(100) t(i);
+    """)
+    src.close()
+    con = duckdb.connect()
+    con.load_extension("spatial")
+    yield con
+    con.close()
+
+def count(con):
+    return con.execute(f"SELECT COUNT(*) FROM {source(CONFIG['output'])};").fetchone()[0]
+
+def test_switch_between_partitioned_and_monolithic(con):
+    export_partitioned(con, "panden", CONFIG, 2000, 1024, 1)
+    assert os.path.exists(os.path.join(partition_dir(CONFIG["output"]), "manifest.json"))
+    assert data_files(CONFIG["output"]) != [CONFIG["output"]]
+    assert count(con) == 100
+
+    # The monolithic export must replace the partitions, not hide behind them
+    con.execute("DELETE FROM panden_src.panden WHERE identificatie::INTEGER >= 60;")
+    partitioned_version = data_version(CONFIG["output"])
+    export_collection(con, "panden", CONFIG, 1024, 1)
+    assert not os.path.exists(partition_dir(CONFIG["output"]))
+    assert data_files(CONFIG["output"]) == [CONFIG["output"]]
+    assert data_version(CONFIG["output"]) != partitioned_version
+    assert count(con) == 60
+
+    # And back: the manifest takes precedence over the monolithic file again
+    con.execute("DELETE FROM panden_src.panden WHERE identificatie::INTEGER >= 30;")
+    export_partitioned(con, "panden", CONFIG, 2000, 1024, 1)
+    assert data_files(CONFIG["output"]) != [CONFIG["output"]]
+    assert count(con) == 30
+
+def test_partitions_do_not_share_the_ingest_directory(con):
+    # vbo.py reads its XML from vbo/, next to vbo.parquet
+    assert partition_dir("vbo.parquet") != "vbo"
+
+def test_incremental_export_refreshes_building_metrics(con):
+    config = dict(CONFIG, metrics=True)
+    # Written through the export connection, which then reuses the attachment
+    attach(con, "verblijfsobjecten", "vbo.db", read_only=False)
+    con.execute("CREATE TABLE verblijfsobjecten_src.verblijfsobjecten (identificatie TEXT, pand TEXT, oppervlakte INTEGER);")
+    con.execute("INSERT INTO verblijfsobjecten_src.verblijfsobjecten VALUES ('v1', '5', 50), ('v2', '5', 70);")
+    export_partitioned(con, "panden", config, 2000, 1024, 1)
+    assert export_partitioned(con, "panden", config, 2000, 1024, 1, incremental=True) == 0
+
+    # A verblijfsobject mutation leaves the panden mutation log empty
+    con.execute("INSERT INTO verblijfsobjecten_src.verblijfsobjecten VALUES ('v3', '5', 30), ('v4', '77', 20);")
+    assert export_partitioned(con, "panden", config, 2000, 1024, 1, incremental=True) == 2
+    metrics = con.execute(f"""
+        SELECT identificatie, vbo_count, oppervlakte FROM {source(CONFIG['output'])}
+        WHERE vbo_count > 0 ORDER BY identificatie;
+    """).fetchall()
+    assert metrics == [("5", 3, 150), ("77", 1, 20)]
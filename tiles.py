@@ -0,0 +1,87 @@
+import os
+import shutil
+import threading
+from cache import LRUCache
+
+# RD New tile matrix of the web map (website/main.js): resolution per zoom level, top left origin, 256 px tiles
+RESOLUTIONS = [3440.640, 1720.320, 860.160, 430.080, 215.040, 107.520, 53.760, 26.880,
+               13.440, 6.720, 3.360, 1.680, 0.840, 0.420, 0.210, 0.105]
+ORIGIN = (-285401.920, 903401.920)
+TILE_SIZE = 256
+
+# Coordinates are quantized to a grid of EXTENT x EXTENT per tile; BUFFER units outside the tile are kept
+# so polygons do not show seams at the tile edges
+EXTENT = 4096
+BUFFER = 64
+
+# Simplified footprints the export writes next to the full geometry of the panden: column -> tolerance in metres.
+# They are snapped to a grid of SIMPLIFIED_PRECISION metres, which is all a map at those scales can show.
+SIMPLIFIED = {
+    "geom_1m": 1,
+    "geom_4m": 4,
+    "geom_16m": 16,
+}
+SIMPLIFIED_PRECISION = 0.01
+
+# Cell sizes in metres of the grid pyramid of statistics the export writes (db_to_parquet.py, grid.parquet)
+GRID_SIZES = [100, 400, 1600, 6400, 25600]
+
+def simplified_column(resolution):
+    # The coarsest footprint that still deviates less than a pixel of resolution metres, else the full geometry
+    column = "geom"
+    for name, tolerance in sorted(SIMPLIFIED.items(), key=lambda item: item[1]):
+        if tolerance <= resolution:
+            column = name
+    return column
+
+def tile_bounds(z, x, y):
+    # (minx, miny, maxx, maxy) of a tile in RD New, or None when it is not on the tile matrix
+    if not 0 <= z < len(RESOLUTIONS):
+        return None
+    span = RESOLUTIONS[z] * TILE_SIZE
+    # Every zoom level halves the resolution, so level z has 2^z x 2^z tiles
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return None
+    minx = ORIGIN[0] + x * span
+    maxy = ORIGIN[1] - y * span
+    return (minx, maxy - span, minx + span, maxy)
+
+class TileCache:
+    # Encoded tiles in memory (least recently used out first, bounded in bytes) and on disk under
+    # <directory>/<collection>/<data version>/<z>/<x>/<y>.mvt. Tiles of an older version are never read again;
+    # their directory is removed when the first tile of a new version is stored.
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.memory = LRUCache(max_bytes)
+
+    def path(self, key):
+        collection, version, z, x, y = key
+        return os.path.join(self.directory, collection, version, str(z), str(x), f"{y}.mvt")
+
+    def get(self, key):
+        tile = self.memory.get(key)
+        if tile is not None:
+            return tile
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            tile = f.read()
+        self.memory.put(key, tile, len(tile))
+        return tile
+
+    def put(self, key, tile):
+        path = self.path(key)
+        version_dir = os.path.join(self.directory, key[0], key[1])
+        if not os.path.exists(version_dir):
+            collection_dir = os.path.join(self.directory, key[0])
+            if os.path.isdir(collection_dir):
+                for old in os.listdir(collection_dir):
+                    if old != key[1]:
+                        shutil.rmtree(os.path.join(collection_dir, old), ignore_errors=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(tile)
+        os.replace(tmp, path)
+        self.memory.put(key, tile, len(tile))
@@ -1,7 +1,26 @@
-import duckdb as db
+import argparse
 import time
+import zipfile
+from archive import find_sources
+from extract import stream_to_db, VBO
+from ingest import connect, create_table, ingest_parallel
 
-def xml_to_db(XML_PATH):
+# Database, table and columns the ingest writes
+DB_PATH = 'vbo.db'
+TABLE = "verblijfsobjecten"
+COLUMNS = """
+  identificatie TEXT,
+  status TEXT,
+  gebruiksdoel TEXT,
+  documentdatum DATE,
+  oppervlakte INTEGER,
+  pand TEXT,
+  hoofdadres TEXT,
+  voorkomenidentificatie INTEGER,
+  geom GEOMETRY
+"""
+
+def xml_to_db(con, TABLE, XML_PATH):
     con.sql(f"""
     INSERT INTO {TABLE}
     WITH docs AS (
@@ -20,6 +39,7 @@ def xml_to_db(XML_PATH):
         TRY_CAST(xml_extract_text(vbo_xml, '//Objecten:documentdatum')[1] AS DATE) AS documentdatum,
         xml_extract_text(vbo_xml, '//Objecten-ref:PandRef')[1] AS pand,
         xml_extract_text(vbo_xml, '//Objecten:heeftAlsHoofdadres/Objecten-ref:NummeraanduidingRef')[1] AS hoofdadres,
+        TRY_CAST(xml_extract_text(vbo_xml, '//Historie:voorkomenidentificatie')[1] AS INTEGER) AS voorkomenidentificatie,
         xml_extract_text(vbo_xml, '//gml:pos')[1] AS pos
       FROM vbos_xml
       WHERE xml_extract_text(vbo_xml, '//Historie:eindGeldigheid')[1] IS NULL
@@ -32,6 +52,7 @@ def xml_to_db(XML_PATH):
       oppervlakte,
       pand,
       hoofdadres,
+      voorkomenidentificatie,
       ST_GeomFromText(
         'POINT(' ||
             list_extract(nums, 1) || ' ' || list_extract(nums, 2) ||
@@ -46,42 +67,45 @@ def xml_to_db(XML_PATH):
         oppervlakte,
         pand,
         hoofdadres,
+        voorkomenidentificatie,
         list_filter(str_split(pos, ' '), x -> x <> '') AS nums
       FROM extracted
     ) t
     """)
 
+def xml_to_db_stream(con, TABLE, XML_PATH):
+    stream_to_db(con, TABLE, XML_PATH, VBO)
+
 if __name__ == "__main__":
-    con = db.connect('vbo.db')
-    con.install_extension("spatial")
-    con.load_extension("spatial")
-    con.execute("INSTALL webbed FROM community")
-    con.load_extension("webbed")
+    parser = argparse.ArgumentParser(description="Ingest the BAG VBO extract into vbo.db")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (1 = sequential)")
+    parser.add_argument("--extractor", choices=["sql", "stream"], default="stream",
+                        help="sql: read_xml_objects + XPath in DuckDB, stream: single-pass incremental parser")
+    parser.add_argument("--source", default="vbo",
+                        help="directory with the extracted files or the (nested) LVBAG delivery zip")
+    args = parser.parse_args()
+
+    if args.extractor == "sql" and zipfile.is_zipfile(args.source):
+        parser.error("the sql extractor needs extracted files, use --extractor stream to read from the zip")
 
-    TABLE = "verblijfsobjecten"
+    files = find_sources(args.source, '*VBO*.xml', zips='*VBO*.zip')
+
+    extractor = xml_to_db if args.extractor == "sql" else xml_to_db_stream
+    webbed = args.extractor == "sql"
 
     tic = time.time()
 
-    con.sql(f"DROP TABLE IF EXISTS {TABLE};")
-    con.sql(f"""
-    CREATE TABLE {TABLE} (
-      identificatie TEXT,
-      status TEXT,
-      gebruiksdoel TEXT,
-      documentdatum DATE,
-      oppervlakte INTEGER,
-      pand TEXT,
-      hoofdadres TEXT,
-      geom GEOMETRY
-    );
-    """)
+    if args.workers > 1:
+        con = ingest_parallel(extractor, DB_PATH, TABLE, COLUMNS, files, args.workers, webbed)
+    else:
+        con = connect(DB_PATH, webbed)
+        create_table(con, TABLE, COLUMNS)
 
-    for i in range(1,2534):
-        XML_PATH = f'vbo\9999VBO08122025-{i:06d}.xml'
-        if i%100 == 0:
-            print(i)
-            print("time:", (time.time() - tic), "s")
-        xml_to_db(XML_PATH)
+        for i, XML_PATH in enumerate(files, start=1):
+            if i%100 == 0:
+                print(i)
+                print("time:", (time.time() - tic), "s")
+            extractor(con, TABLE, XML_PATH)
 
     tac = time.time()
 
@@ -2,12 +2,13 @@
 
 // Definition Rijksdriehoekstelsel (EPSG:28992)
 let res = [3440.640, 1720.320, 860.160, 430.080, 215.040, 107.520, 53.760, 26.880, 13.440, 6.720, 3.360, 1.680, 0.840, 0.420, 0.210, 0.105];
+let rdOrigin = [-285401.920, 903401.920];
 let map = L.map('map-canvas', {
   continuousWorld: true,
   crs: new L.Proj.CRS('EPSG:28992', '+proj=sterea +lat_0=52.15616055555555 +lon_0=5.38763888888889 +k=0.9999079 +x_0=155000 +y_0=463000 +ellps=bessel +units=m +towgs84=565.2369,50.0087,465.658,-0.406857330322398,0.350732676542563,-1.8703473836068,4.0812 +no_defs', {
     //transformation: L.Transformation(-1, -1, 0, 0),
     resolutions: res,
-    origin: [-285401.920, 903401.920],
+    origin: rdOrigin,
     bounds: L.bounds([-285401.920, 903401.920], [595401.920, 22598.080])
   }),
   layers: [],
@@ -38,8 +39,119 @@ let baseLayers = {
 
 // ===== BUILDING VISUALISATION =====
 
+// Buildings are loaded per tile of the RD tile matrix of the map (the tiles of the basemap, and of the vector
+// tiles of the API), from this zoom level on. Zoomed out further, a view would hold whole cities of buildings.
+const MIN_BUILDING_ZOOM = 11;
+const TILE_SIZE = 256;
+
+// Loaded tiles in memory: tile key -> buildings. A Map keeps its insertion order, so the least recently used
+// tile comes first and is dropped first when there are more than MAX_CACHED_TILES.
+const MAX_CACHED_TILES = 512;
+let tileCache = new Map();
+
+// Tiles being loaded: tile key -> AbortController of their request
+let tileRequests = new Map();
+
+// One canvas with all buildings in view, instead of a Leaflet layer (and SVG path) per building
+let BuildingsCanvas = L.Layer.extend({
+    onAdd: function (map) {
+        // Hidden while Leaflet animates a zoom, drawn again at the new zoom level when it ends
+        this._canvas = L.DomUtil.create('canvas', 'leaflet-zoom-hide');
+        this._buildings = [];
+        map.getPane('overlayPane').appendChild(this._canvas);
+        map.on('moveend', this.redraw, this);
+        map.on('click', this._onClick, this);
+        this.redraw();
+    },
+
+    onRemove: function (map) {
+        L.DomUtil.remove(this._canvas);
+        map.off('moveend', this.redraw, this);
+        map.off('click', this._onClick, this);
+    },
+
+    // Draw again at the next animation frame, once however many tiles came in since the last one
+    redraw: function () {
+        if (this._map && !this._frame) {
+            this._frame = L.Util.requestAnimFrame(() => {
+                this._frame = null;
+                this._draw();
+            });
+        }
+        return this;
+    },
+
+    _draw: function () {
+        if (!this._map) return;
+        const map = this._map;
+        const size = map.getSize();
+        const ratio = window.devicePixelRatio || 1;
+
+        // The canvas covers the view; while panning it moves along with the map until it is drawn again
+        const topLeft = map.containerPointToLayerPoint([0, 0]);
+        L.DomUtil.setPosition(this._canvas, topLeft);
+        this._canvas.width = size.x * ratio;
+        this._canvas.height = size.y * ratio;
+        this._canvas.style.width = `${size.x}px`;
+        this._canvas.style.height = `${size.y}px`;
+        const ctx = this._canvas.getContext('2d');
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+
+        // RD New is the projection of the map, so RD coordinates map to canvas pixels with a scale and an offset
+        // (no proj4 per vertex)
+        const crs = map.options.crs;
+        const scale = crs.scale(map.getZoom());
+        const o = crs.transformation.transform(L.point(0, 0), scale);
+        const e = crs.transformation.transform(L.point(1, 1), scale);
+        const pixelOrigin = map.getPixelOrigin();
+        const ax = e.x - o.x, bx = o.x - pixelOrigin.x - topLeft.x;
+        const ay = e.y - o.y, by = o.y - pixelOrigin.y - topLeft.y;
+
+        // A building on a tile edge comes with both tiles, it is drawn once. All buildings are one path, so the
+        // canvas fills and strokes once per frame.
+        const drawn = new Set();
+        this._buildings = [];
+        ctx.beginPath();
+        tilesInView().forEach(tile => {
+            (tileCache.get(tile.key) || []).forEach(building => {
+                if (drawn.has(building.id)) return;
+                drawn.add(building.id);
+                this._buildings.push(building);
+                building.rings.forEach(ring => {
+                    ctx.moveTo(ax * ring[0] + bx, ay * ring[1] + by);
+                    for (let i = 2; i < ring.length; i += 2) {
+                        ctx.lineTo(ax * ring[i] + bx, ay * ring[i + 1] + by);
+                    }
+                    ctx.closePath();
+                });
+            });
+        });
+        ctx.fillStyle = 'rgba(252, 165, 165, 0.4)'; // Semi-transparent light red fill
+        ctx.fill('evenodd');
+        ctx.strokeStyle = '#ef4444';                // Red outline
+        ctx.lineWidth = 2;                          // Line thickness
+        ctx.stroke();
+    },
+
+    // Popup with the properties of the building that was clicked
+    _onClick: function (e) {
+        if (isDrawing) return;
+        const point = this._map.options.crs.project(e.latlng);
+        const building = this._buildings.find(b => containsPoint(b, point.x, point.y));
+        if (!building) return;
+
+        let popupContent = '<div style="font-size: 0.875rem;">';
+        popupContent += `<strong>Building ID:</strong> ${building.id || 'N/A'}<br>`;
+        for (let key in building.properties) {
+            popupContent += `<strong>${key}:</strong> ${building.properties[key]}<br>`;
+        }
+        popupContent += '</div>';
+        L.popup().setLatLng(e.latlng).setContent(popupContent).openOn(this._map);
+    }
+});
+
 // Layer to hold building geometries
-let buildingsLayer = L.layerGroup().addTo(map);
+let buildingsLayer = new BuildingsCanvas().addTo(map);
 
 //// VERSION 1: Load single test building
 //async function loadTestBuilding() {
@@ -65,91 +177,151 @@ let buildingsLayer = L.layerGroup().addTo(map);
 //    }
 //}
 
-// VERSION 2: Load buildings in visible viewport
-async function loadBuildingsInView() {
-    // Get visible map bounds
+// VERSION 2: Load buildings in visible viewport, per tile
+
+// Function: The tiles of the RD tile matrix that cover the view at the current zoom level
+function tilesInView() {
+    const z = map.getZoom();
+    if (z < MIN_BUILDING_ZOOM) return [];
     const bounds = getVisibleBounds();
+    const span = res[z] * TILE_SIZE;
+
+    let tiles = [];
+    for (let x = Math.floor((bounds.xmin - rdOrigin[0]) / span); x <= Math.floor((bounds.xmax - rdOrigin[0]) / span); x++) {
+        for (let y = Math.floor((rdOrigin[1] - bounds.ymax) / span); y <= Math.floor((rdOrigin[1] - bounds.ymin) / span); y++) {
+            const minx = rdOrigin[0] + x * span;
+            const maxy = rdOrigin[1] - y * span;
+            tiles.push({ key: `${z}/${x}/${y}`, z: z, bounds: [minx, maxy - span, minx + span, maxy] });
+        }
+    }
+    return tiles;
+}
 
-    // Build API URL with bbox filter
-    //const apiUrl = `https://godzilla.bk.tudelft.nl/2dbagparquet/api/collections/panden/items?minx=${bounds.xmin}&miny=${bounds.ymin}&maxx=${bounds.xmax}&maxy=${bounds.ymax}&limit=200`;
-    const apiUrl = `http://127.0.0.1:8000/collections/panden/items?minx=${bounds.xmin}&miny=${bounds.ymin}&maxx=${bounds.xmax}&maxy=${bounds.ymax}&limit=200`;
+// Function: Load the tiles in view that are not cached yet, and cancel the requests for tiles out of view
+function loadBuildingsInView() {
+    const tiles = tilesInView();
+    const keys = new Set(tiles.map(tile => tile.key));
 
-    try {
-        console.log('Loading buildings in viewport from:', apiUrl);
-        const response = await fetch(apiUrl);
+    tileRequests.forEach((controller, key) => {
+        if (!keys.has(key)) {
+            controller.abort();
+            tileRequests.delete(key);
+        }
+    });
 
-        if (!response.ok) {
-            throw new Error(`API error: ${response.status}`);
+    tiles.forEach(tile => {
+        if (tileCache.has(tile.key)) {
+            // Used again, so it moves to the end of the cache
+            cacheTile(tile.key, tileCache.get(tile.key));
+        } else if (!tileRequests.has(tile.key)) {
+            loadTile(tile);
         }
+    });
+}
 
-        const data = await response.json();
-        console.log(`Loaded ${data.features ? data.features.length : 0} buildings`);
+// Function: Keep the buildings of a tile, dropping the least recently used tiles when the cache is full
+function cacheTile(key, buildings) {
+    tileCache.delete(key);
+    tileCache.set(key, buildings);
+    while (tileCache.size > MAX_CACHED_TILES) {
+        tileCache.delete(tileCache.keys().next().value);
+    }
+}
 
-        // Clear existing buildings
-        buildingsLayer.clearLayers();
+// Function: Load all buildings that intersect a tile, following the next links, until it leaves the view
+async function loadTile(tile) {
+    const controller = new AbortController();
+    tileRequests.set(tile.key, controller);
+
+    // Coordinates in RD New (the default CRS of the API and the projection of the map), footprints simplified
+    // for the zoom level and snapped to a power of ten below a tenth of a pixel, which keeps the numbers short
+    const [minx, miny, maxx, maxy] = tile.bounds;
+    const precision = Math.pow(10, Math.floor(Math.log10(res[tile.z] / 10)));
+    const query = `minx=${minx}&miny=${miny}&maxx=${maxx}&maxy=${maxy}&relation=intersects&zoom=${tile.z}&precision=${precision}&count=false&limit=1000`;
+    //const baseUrl = `https://godzilla.bk.tudelft.nl/2dbagparquet/api/collections/panden/items`;
+    const baseUrl = `http://127.0.0.1:8000/collections/panden/items`;
+    let pageUrl = `${baseUrl}?${query}`;
+    let buildings = [];
 
-        // Add each building to the map
-        if (data.features && data.features.length > 0) {
-            data.features.forEach(feature => {
-                displayBuilding(feature);
+    try {
+        while (pageUrl) {
+            const response = await fetch(pageUrl, { signal: controller.signal });
+
+            if (!response.ok) {
+                throw new Error(`API error: ${response.status}`);
+            }
+
+            const data = await response.json();
+            (data.features || []).forEach(feature => {
+                const building = toBuilding(feature);
+                if (building) buildings.push(building);
             });
+
+            const next = (data.links || []).find(link => link.rel === 'next');
+            pageUrl = next ? `${baseUrl}?${next.href.split('?')[1]}` : null;
         }
 
+        console.log(`Loaded ${buildings.length} buildings of tile ${tile.key}`);
+        cacheTile(tile.key, buildings);
+        buildingsLayer.redraw();
+
     } catch (error) {
-        console.error('Failed to load buildings in viewport:', error);
+        if (error.name !== 'AbortError') {
+            console.error(`Failed to load buildings of tile ${tile.key}:`, error);
+        }
+    } finally {
+        if (tileRequests.get(tile.key) === controller) {
+            tileRequests.delete(tile.key);
+        }
     }
 }
 
-// Function: Display a single building on the map
-function displayBuilding(feature) {
+// Function: Cancel all requests for tiles
+function abortTileRequests() {
+    tileRequests.forEach(controller => controller.abort());
+    tileRequests.clear();
+}
+
+// Function: A building as the canvas draws it: the rings of its footprint as flat [x0, y0, x1, y1, ...] arrays
+// of RD coordinates, and its bbox to find it again on a click
+function toBuilding(feature) {
     // Check if feature has geometry
     if (!feature.geometry || !feature.geometry.coordinates) {
         console.warn('Building has no geometry:', feature);
-        return;
+        return null;
     }
 
-    // Convert GeoJSON to Leaflet layer
-    let buildingLayer = L.geoJSON(feature, {
-        style: {
-            color: '#ef4444',        // Red outline
-            weight: 2,               // Line thickness
-            fillColor: '#fca5a5',    // Light red fill
-            fillOpacity: 0.4         // Semi-transparent
-        },
-        // CRITICAL: Convert RD coordinates to lat/lng
-        coordsToLatLng: function(coords) {
-            // coords = [x, y] in RD (EPSG:28992)
-            // Need to convert to [lng, lat] for proj4, then to Leaflet's [lat, lng]
-
-            let wgs84 = proj4('EPSG:28992', 'EPSG:4326', [coords[0], coords[1]]);
-            // wgs84 = [lng, lat]
-
-            return L.latLng(wgs84[1], wgs84[0]); // Leaflet wants [lat, lng]
-        },
-        onEachFeature: function(feature, layer) {
-            // Add popup with building info
-            if (feature.properties) {
-                let popupContent = '<div style="font-size: 0.875rem;">';
-                popupContent += `<strong>Building ID:</strong> ${feature.id || 'N/A'}<br>`;
-
-                // Add other properties
-                for (let key in feature.properties) {
-                    popupContent += `<strong>${key}:</strong> ${feature.properties[key]}<br>`;
-                }
+    const polygons = feature.geometry.type === 'MultiPolygon' ? feature.geometry.coordinates : [feature.geometry.coordinates];
+    let rings = [];
+    let bbox = [Infinity, Infinity, -Infinity, -Infinity];
+    polygons.forEach(polygon => polygon.forEach(coords => {
+        let ring = new Float64Array(coords.length * 2);
+        coords.forEach((c, i) => {
+            ring[2 * i] = c[0];
+            ring[2 * i + 1] = c[1];
+            bbox = [Math.min(bbox[0], c[0]), Math.min(bbox[1], c[1]), Math.max(bbox[2], c[0]), Math.max(bbox[3], c[1])];
+        });
+        rings.push(ring);
+    }));
+
+    return { id: feature.properties.id, properties: feature.properties, rings: rings, bbox: bbox };
+}
 
-                popupContent += '</div>';
-                layer.bindPopup(popupContent);
+// Function: Whether an RD point lies inside the footprint of a building (even-odd, so courtyards are outside)
+function containsPoint(building, x, y) {
+    const bbox = building.bbox;
+    if (x < bbox[0] || x > bbox[2] || y < bbox[1] || y > bbox[3]) return false;
+
+    let inside = false;
+    building.rings.forEach(ring => {
+        for (let i = 0, j = ring.length - 2; i < ring.length; j = i, i += 2) {
+            if ((ring[i + 1] > y) !== (ring[j + 1] > y) &&
+                x < (ring[j] - ring[i]) * (y - ring[i + 1]) / (ring[j + 1] - ring[i + 1]) + ring[i]) {
+                inside = !inside;
             }
         }
     });
-
-    // Add to buildings layer
-    buildingLayer.addTo(buildingsLayer);
-
-    // Zoom to the building (helpful for testing)
-//    if (shouldZoom) {
-//        map.fitBounds(buildingLayer.getBounds());
-//    }
+    return inside;
 }
 
 //// Load test building on page load (VERSION 1 - for testing)
@@ -171,10 +343,9 @@ function debounce(fn, delay) {
 const debouncedLoadBuildings = debounce(loadBuildingsInView, 300);
 
 
-//loadBuildingsInView();  // Initial load
-//map.on('moveend', debouncedLoadBuildings);
-//map.on('moveend', loadBuildingsInView);  // Reload when map stops moving
-//map.on('zoomend', loadBuildingsInView);  // Reload when zoom changes
+// The buildings layer is on from the start
+loadBuildingsInView();  // Initial load
+map.on('moveend', debouncedLoadBuildings);
 
 // Only load building visualisation when layer is turned on
 map.on('overlayadd', function (e) {
@@ -195,8 +366,8 @@ map.on('overlayremove', function (e) {
         // Stop listening
         map.off('moveend', debouncedLoadBuildings);
 
-        // Optional: clear buildings from map
-        buildingsLayer.clearLayers();
+        // Tiles still loading are not needed anymore; the loaded ones stay cached for when it is turned on again
+        abortTileRequests();
     }
 });
 
@@ -594,16 +765,15 @@ async function downloadVboGeoJSON() {
 
 
 // Function: Fetch all pages from paginated API
+// The API pages with a cursor, so instead of counting offsets we follow the "next" link of every page
 async function fetchAllPages(baseUrl) {
     let allFeatures = [];
-    let offset = 0;
     let limit = 50; // change to 10000 for godzilla api
     let totalCount = null;
+    let pageUrl = `${baseUrl}&limit=${limit}`;
 
-    while (true) {
-        // Add limit and offset parameters to URL
-        const pageUrl = `${baseUrl}&limit=${limit}&offset=${offset}`;
-        console.log(`Fetching: offset=${offset}, limit=${limit}...`);
+    while (pageUrl) {
+        console.log(`Fetching: ${pageUrl}...`);
 
         try {
             const response = await fetch(pageUrl);
@@ -615,40 +785,26 @@ async function fetchAllPages(baseUrl) {
             const data = await response.json();
 
             // Get total count from first response
-            if (totalCount === null && data.total_count !== undefined) {
-                totalCount = data.total_count;
+            if (totalCount === null && data.total_feature_count !== undefined) {
+                totalCount = data.total_feature_count;
                 console.log(`Total count: ${totalCount} features`);
                 }
 
-            // Check if data has features
+            // Add features from this page
             if (data.features && data.features.length > 0) {
-                // Add features from this page
                 allFeatures = allFeatures.concat(data.features);
                 console.log(`Got ${data.features.length} features (total so far: ${allFeatures.length}${totalCount ? `/${totalCount}` : ''})`);
+                }
 
-                // Move to next page
-                offset += limit;
-
-                // Stop if we've fetched everything
-                if (totalCount !== null && offset >= totalCount) {
-                    console.log('Reached total count, stopping');
-                    break;
-                    }
-
-                // Or stop if this page had fewer features than limit
-                if (data.features.length < limit) {
-                    console.log('Last page (fewer features than limit), stopping');
-                    break;
-                    }
-
-            } else {
-                // No features on this page, we're done
-                console.log('No more features, stopping');
-                break;
+            // Continue with the query of the next link (same endpoint), or stop on the last page
+            const next = (data.links || []).find(link => link.rel === 'next');
+            pageUrl = next ? `${baseUrl.split('?')[0]}?${next.href.split('?')[1]}` : null;
+            if (!pageUrl) {
+                console.log('Last page, stopping');
                 }
 
         } catch (error) {
-            console.error(`Error fetching at offset ${offset}:`, error);
+            console.error(`Error fetching ${pageUrl}:`, error);
             throw error;
             }
     }